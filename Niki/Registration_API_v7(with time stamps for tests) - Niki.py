@@ -1,20 +1,55 @@
+import argparse
+import atexit
+import hashlib
 import json
 import os
-import subprocess
-import random
-import string
-import time
-import mysql.connector
+import re
+import sys
+from confluent_kafka import KafkaError
 from confluent_kafka.admin import AdminClient, NewTopic
-from confluent_kafka import Producer
-from CLItool import extract_did_from_private_key
+from kafka_producer import AsyncProducer
+from registry_storage import open_storage
+from stage_timer import StageTimer
+from topic_pool import TopicPool
+from hsml_validators import might_be_hsml, validate_hsml
+from existence_filter import ExistenceFilter
+from session_cache import SessionManager, token_fingerprint
+from content_hash import DUPLICATE_POLICIES, canonical_hash, duplicate_key
+from output_writer import OutputWriter, OutputWriteError
+from outbox_relay import OutboxRelay
+from agent_consumer import AgentConsumer
+from agent_topics import AGENT_TOPIC_MODES, SharedAgentTopics, parse_topic_address
+from message_codec import AGENT_REGISTERED, CODECS, encode_message, get_codec
+from did_keygen import KEYGEN_CHUNK_SIZE, KeyPool, did_from_private_key_pem, extract_did_from_private_key, generate_did_key_pairs
 
 # Kafka Configuration
 KAFKA_CONFIG = {
     "bootstrap.servers": "localhost:9092"
 }
 admin_client = AdminClient(KAFKA_CONFIG)
-producer = Producer(KAFKA_CONFIG)
+
+# Asynchronous producer: messages are batched and only flushed on shutdown or when a caller asks
+KAFKA_LINGER_MS = 5
+KAFKA_BATCH_SIZE = 65536
+KAFKA_COMPRESSION = "lz4"
+# Encoding of registry messages: json, orjson (same JSON, faster) or msgpack (smaller); consumers decode any of
+# them with message_codec.decode_message, which reads the content-type, schema and schema-version headers
+KAFKA_MESSAGE_CODEC = os.environ.get("KAFKA_MESSAGE_CODEC", "json")
+producer = AsyncProducer(KAFKA_CONFIG, linger_ms=KAFKA_LINGER_MS, batch_size=KAFKA_BATCH_SIZE, compression=KAFKA_COMPRESSION)
+atexit.register(producer.close)
+
+# Per-stage latency histograms for the registration path (export with registration_timer.write)
+registration_timer = StageTimer()
+
+# Private keys and updated JSON files are saved by a background writer (atomically, temp file then rename),
+# so a registration returns once its DB commit succeeds instead of waiting on a slow or shared drive
+OUTPUT_QUEUE_SIZE = 1000
+output_writer = OutputWriter(max_queue=OUTPUT_QUEUE_SIZE)
+atexit.register(output_writer.close)
+
+# Pre-generated DID:keys, topped up in the background so registrations never wait on key generation
+KEY_POOL_SIZE = 32
+key_pool = KeyPool(size=KEY_POOL_SIZE)
 
 # MySQL Database Configuration
 db_config = {
@@ -24,206 +59,356 @@ db_config = {
     "database": "did_registry"
 }
 
-# Connect to MySQL
-def connect_db():
-    return mysql.connector.connect(**db_config)
-
-# Function to create a Kafka topic for Agents
-def create_kafka_topic(topic_name, num_partitions=1, replication_factor=1):
-    start_time_create_kafka = time.time()
-    """Creates a Kafka topic using Confluent Kafka AdminClient"""
-    topic_list = [NewTopic(topic_name, num_partitions=num_partitions, replication_factor=replication_factor)]
+# Where registered private keys and JSON files are saved
+DEFAULT_OUTPUT_DIRECTORY = "C:/Users/nnamian/OneDrive - JPL/Desktop/Digital Twin Interoperability/Codes/HSML Examples/registeredExamples"
+
+# Registry storage: MySQL (db_config) by default, or an embedded SQLite file on nodes without a database
+# server (REGISTRY_BACKEND=sqlite, REGISTRY_SQLITE_PATH). Both keep a pool of connections.
+REGISTRY_BACKEND = os.environ.get("REGISTRY_BACKEND", "mysql")
+REGISTRY_SQLITE_PATH = os.environ.get("REGISTRY_SQLITE_PATH", "did_registry.db")
+DB_POOL_SIZE = 8
+storage = open_storage(REGISTRY_BACKEND, mysql_config=db_config, sqlite_path=REGISTRY_SQLITE_PATH, pool_size=DB_POOL_SIZE)
+
+# Transaction on a pooled connection: commits on success, rolls back on error and always returns the connection.
+# Pass its cursor to the storage operations that must commit together.
+def db_cursor():
+    return storage.transaction()
+
+# Bloom filters of registered DIDs and Kafka topics, updated on every insert: a definite miss means a freshly
+# generated DID needs no database round trip. Long-lived processes (registration_service.py) load it at startup;
+# until then every lookup answers "maybe". Another process may have registered a value since the load, so
+# caller-supplied swids are always checked in the database.
+registry_filter = ExistenceFilter()
+
+# Function to keep only the freshly generated values the existence filter cannot rule out (the rest are certainly not registered)
+def maybe_registered(column, values):
+    may_contain = registry_filter.may_contain_did if column == "did" else registry_filter.may_contain_topic
+    return [value for value in values if may_contain(value)]
+
+# Function to create several Kafka topics with a single AdminClient request
+def create_kafka_topics(topic_names, num_partitions=1, replication_factor=1):
+    """Creates Kafka topics using Confluent Kafka AdminClient and returns the names that exist afterwards"""
+    if not topic_names:
+        return set()
+    topic_list = [NewTopic(topic_name, num_partitions=num_partitions, replication_factor=replication_factor) for topic_name in topic_names]
     fs = admin_client.create_topics(topic_list)
-    
+
+    created = set()
     for topic, f in fs.items():
         try:
             f.result()  # Block until topic creation is done
+            created.add(topic)
             print(f"Kafka topic '{topic}' created successfully.")
         except Exception as e:
-            print(f"Failed to create topic '{topic}': {e}")
-    end_time_create_kafka = time.time()
-    total_time_create_kafka = end_time_create_kafka - start_time_create_kafka
-    print()
-    print(f"It took {total_time_create_kafka:.2f} seconds to create the Kafka topic name.")
-    print()
+            # Topic names come from the Agent's DID, so an existing one is this Agent's (e.g. a retried creation)
+            error = e.args[0] if e.args else None
+            if isinstance(error, KafkaError) and error.code() == KafkaError.TOPIC_ALREADY_EXISTS:
+                created.add(topic)
+            else:
+                print(f"Failed to create topic '{topic}': {e}")
+    return created
+
+# Function to find which of the given topic names are already assigned to an Agent
+def find_assigned_topics(topic_names):
+    return storage.existing("kafka_topic", topic_names)
+
+# Function to lease pooled topics to one process in the registry, so no two processes hand out the same topic
+def claim_pooled_topics(topic_names, owner, lease_seconds):
+    return storage.claim_pooled_topics(topic_names, owner, lease_seconds)
+
+# Function to drop the leases of pooled topics that were handed to an Agent
+def forget_pooled_topics(topic_names):
+    storage.forget_pooled_topics(topic_names)
+
+# Kafka topics created ahead of time and handed out one per new Agent, refilled in the background
+TOPIC_POOL_SIZE = 16
+TOPIC_POOL_LEASE_SECONDS = 600
+topic_pool = TopicPool(admin_client, size=TOPIC_POOL_SIZE, find_assigned=find_assigned_topics, claim=claim_pooled_topics,
+                       forget=forget_pooled_topics, lease_seconds=TOPIC_POOL_LEASE_SECONDS)
+
+# Agent topics: "dedicated" gives every Agent a topic of its own; "shared" puts all Agents on a few partitioned topics,
+# keyed by DID (did_keys.kafka_topic is then "<topic>#<did>"), so the broker's topic count stays flat as Agents grow
+AGENT_TOPIC_MODE = os.environ.get("AGENT_TOPIC_MODE", "dedicated")
+shared_agent_topics = SharedAgentTopics(count=int(os.environ.get("SHARED_AGENT_TOPIC_COUNT", 8)),
+                                        partitions=int(os.environ.get("SHARED_AGENT_TOPIC_PARTITIONS", 32)))
+
+# Function to create the topics outbox messages are waiting for: shared topics with their partitions, once per process
+def create_outbox_topics(topic_names):
+    shared = [topic for topic in topic_names if shared_agent_topics.is_shared(topic)]
+    dedicated = [topic for topic in topic_names if not shared_agent_topics.is_shared(topic)]
+    return shared_agent_topics.ensure(shared, create_kafka_topics) | create_kafka_topics(dedicated)
+
+# Function to hand a message from the Kafka outbox to the producer
+def publish_outbox_message(topic, payload, key=None, schema=None):
+    value, headers = encode_message(json.loads(payload), schema, codec=KAFKA_MESSAGE_CODEC)
+    return producer.send(topic, value, key=key, headers=headers)
+
+# Kafka messages and the topics of new Agents are queued in kafka_outbox with the registration's DB write
+# and published by this relay after the commit, so registering never waits on the broker
+outbox_relay = OutboxRelay(storage, send=publish_outbox_message, create_topics=create_outbox_topics)
+atexit.register(outbox_relay.close)  # Runs before producer.close (atexit is last in, first out)
+
+# Function to build the outbox row announcing a new Agent on its topic address
+def agent_announcement(address, agent_name, create_topic):
+    topic, key = parse_topic_address(address)
+    return (topic, key, json.dumps({"message": f"New Agent registered: {agent_name}"}), create_topic, AGENT_REGISTERED)
 
-#Generate random string for Kafka Topic name (NEW - Niki)
-def generate_random_string(length=6):
-    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=length))
+# Function to create a Kafka topic for Agents
+@registration_timer.timed("topic_creation")
+def create_kafka_topic(topic_name, num_partitions=1, replication_factor=1):
+    """Creates a Kafka topic using Confluent Kafka AdminClient"""
+    create_kafka_topics([topic_name], num_partitions=num_partitions, replication_factor=replication_factor)
+
+# Kafka topic names may only use [a-zA-Z0-9._-] and at most 249 characters
+AGENT_TOPIC_NAME_LENGTH = 200
+AGENT_TOPIC_HASH_LENGTH = 16
+
+# Function to name an Agent's Kafka topic after the Agent and its DID
+def agent_topic_name(agent_name, did_key):
+    """Sanitized name plus a truncated SHA-256 of the DID: DIDs are unique, so the name is unique by construction"""
+    name = re.sub(r"[^a-z0-9._-]+", "_", agent_name.lower()).strip("_")[:AGENT_TOPIC_NAME_LENGTH] or "agent"
+    return f"{name}_{hashlib.sha256(did_key.encode('utf-8')).hexdigest()[:AGENT_TOPIC_HASH_LENGTH]}"
+
+# Function to give a new Agent its topic address
+def new_agent_topic(agent_name, did_key):
+    """Returns (address, create_topic): create_topic tells the outbox relay the topic may not exist yet"""
+    if AGENT_TOPIC_MODE == "shared":
+        return shared_agent_topics.address_for(did_key), True
+    # Dedicated: a pre-created topic from the pool, or one named after the Agent's DID when the pool ran dry
+    topic_name = topic_pool.acquire()
+    if topic_name is None:
+        return agent_topic_name(agent_name, did_key), True
+    return topic_name, False
+
+# Function to give back a pooled topic whose registration did not commit
+def release_agent_topic(address, create_topic):
+    """Topics that still have to be created (named after the DID, or shared) are not pooled and need nothing"""
+    if address is not None and not create_topic:
+        topic_pool.release(address)
 
 # Function to send a Kafka message
-def send_kafka_message(topic, message):
-    start_time_message = time.time()
-    """Sends a message to a Kafka topic"""
-    try:
-        producer.produce(topic, json.dumps(message))
-        producer.flush()
-        print(f"Message sent to Kafka topic '{topic}': {message}")
-    except Exception as e:
-        print(f"Failed to send message to Kafka topic '{topic}': {e}")
-    end_time_message = time.time()
-    total_time_message = end_time_message - start_time_message
-    print()
-    print(f"It took {total_time_message:.2f} seconds to send the message.")
-    print()
-
-# Function to generate DID:key using CLI tool (modified)
+@registration_timer.timed("kafka_send")
+def send_kafka_message(topic, message, wait=False, schema=None):
+    """Queues a message for a Kafka topic and returns a future resolved on delivery (wait=True blocks until then).
+    topic may be an Agent's topic address ("<topic>#<did>" in shared mode, sent keyed by the DID). The message is
+    encoded with KAFKA_MESSAGE_CODEC; schema names it in the message headers."""
+    topic, key = parse_topic_address(topic)
+    def report_delivery(err, msg):
+        if err is not None:
+            print(f"Failed to send message to Kafka topic '{topic}': {err}")
+        else:
+            print(f"Message sent to Kafka topic '{topic}': {message}")
+
+    value, headers = encode_message(message, schema, codec=KAFKA_MESSAGE_CODEC)
+    future = producer.send(topic, value, key=key, headers=headers, callback=report_delivery)
+    if wait:
+        try:
+            future.result()
+        except Exception:
+            pass  # Already reported by report_delivery
+    return future
+
+# Function to block until every queued Kafka message is delivered
+def flush_kafka_messages(timeout=None):
+    return producer.flush(timeout)
+
+# Function to open a consumer that reads Agent topics in batches and fans messages out to in-process subscribers
+def open_agent_consumer(group_id, **options):
+    """One per process: subscribe to each Agent with subscribe_to_agent and read its Subscription, or pass callback="""
+    return AgentConsumer(KAFKA_CONFIG, group_id=group_id, **options)
+
+# Function to subscribe an AgentConsumer to a registered Agent's messages, in either topic mode
+def subscribe_to_agent(agent_consumer, agent_did, **options):
+    address = storage.get_topic(agent_did)
+    if not address:
+        raise ValueError(f"No Kafka topic registered for '{agent_did}'")
+    return agent_consumer.subscribe(address, **options)
+
+# Function to generate DID:key in-process (replaces the CLItool.py subprocess)
+@registration_timer.timed("key_generation")
 def generate_did_key():
-    start_time_gen_key = time.time()
-    """Runs the CLI tool to generate a unique DID:key and extract the private key"""
+    """Takes a pre-generated DID:key from the key pool and checks it is not registered yet"""
     while True:
-        result = subprocess.run(["python", "CLItool.py", "--export-private"], capture_output=True, text=True)
-        print(f"Subprocess output:\n{result.stdout}")  # Add this line for debugging
-        output = result.stdout.split("\n")
-        
-        # Extract DID:key from the stdout (terminal output)
-        did_key = None
-        output = result.stdout.splitlines()
-        
-        for line in output:
-            if line.startswith("Generated DID:key:"):
-                did_key = line.split("Generated DID:key:")[1].strip()
-        
-        if not did_key:
-            raise ValueError("Failed to generate DID:key from output")
+        did_key, private_key = key_pool.get()
+
+        # Not in the existence filter: certainly unique, no query needed
+        if not registry_filter.may_contain_did(did_key):
+            return did_key, private_key
 
-        # Now, read the private key from the saved file "private_key.pem"
-        private_key_path = "private_key.pem"
-        try:
-            with open(private_key_path, "rb") as key_file:
-                private_key = key_file.read()  # Read the private key as bytes
-        except FileNotFoundError:
-            raise ValueError(f"Private key file '{private_key_path}' not found")
-        
         # Check if the generated swid already exists in the database
-        db = connect_db()
-        cursor = db.cursor()
-        cursor.execute("SELECT COUNT(*) FROM did_keys WHERE did = %s", (did_key,))
-        if cursor.fetchone()[0] == 0:  # SWID is unique
+        if not storage.exists(did_key):  # SWID is unique
             # Return DID:key and private key as a PEM string
-            return did_key, private_key.decode("utf-8")  # Decode private key bytes to string
-        end_time_gen_key = time.time()
-        total_time_gen_key = end_time_gen_key - start_time_gen_key
-        print()
-        print(f"It took {total_time_gen_key:.2f} seconds to generate a key.")
-        print()
+            return did_key, private_key
+
+# Function to check a private key belongs to a registered Person or Organization
+@registration_timer.timed("authentication")
+def authenticate(private_key_path=None, private_key_pem=None):
+    """Returns (user_did, user_data, error_message); error_message is None when the login is valid.
+
+    The key is read from private_key_path, or given directly as private_key_pem.
+    """
+    if private_key_pem is not None:
+        user_did = did_from_private_key_pem(private_key_pem)
+    else:
+        user_did = extract_did_from_private_key(private_key_path)
+    user_data = storage.get_metadata(user_did, include_access=False)
+    if user_data is None:
+        return user_did, None, "DID not found in database. Please register first."
+    if user_data.get("@type") not in ["Person", "Organization"]:
+        return user_did, user_data, "Only registered Persons or Organizations can register new entities."
+    return user_did, user_data, None
+
+# Signed session tokens: later registrations by a logged in operator skip key parsing and the metadata query.
+# Set REGISTRATION_SESSION_SECRET to accept tokens across processes and restarts.
+SESSION_TTL_SECONDS = 900
+session_manager = SessionManager(ttl=SESSION_TTL_SECONDS)
+
+# Function to log in with a private key and open a session
+def start_session(private_key_path=None, private_key_pem=None):
+    """Returns (token, user_did, user_data, error_message); token is None when the login is not valid"""
+    user_did, user_data, error = authenticate(private_key_path, private_key_pem)
+    if error:
+        return None, user_did, user_data, error
+    token, _ = session_manager.issue(user_did, user_data["@type"])
+    return token, user_did, user_data, None
+
+# Function to find who a session token belongs to
+@registration_timer.timed("session_check")
+def session_user(token):
+    """Returns (user_did, role), or None for an unknown, expired or tampered token"""
+    return session_manager.verify(token)
 
 # Function for login before registering
-def login_or_register():
-    
-    choice = input("Must be registered in the Spatial Web to register a new Entity. Type 'new' to register or 'login' if already registered: ")
-    db = connect_db()
-    cursor = db.cursor()
-    
+def login_or_register(choice=None, private_key_path=None, session_token=None):
+    """Prompts for anything not passed in, so scripts and benchmarks can log in non-interactively.
+
+    A valid session_token logs in straight away, without a private key.
+    """
+    if session_token is not None:
+        session = session_user(session_token)
+        if session is not None:
+            return session[0]
+        print("Session expired or invalid, please log in again.")
+    if choice is None:
+        choice = input("Must be registered in the Spatial Web to register a new Entity. Type 'new' to register or 'login' if already registered: ")
     if choice.lower() == "new":
         print("Registering a new user. You can only register a Person or Organization.")
         return None
     elif choice.lower() == "login":
-        private_key_path = input("Provide your private_key.pem path: ")
-        start_time_auth = time.time()
-        user_did = extract_did_from_private_key(private_key_path)
-        cursor.execute("SELECT metadata FROM did_keys WHERE did = %s", (user_did,))
-        result = cursor.fetchone()
-        if not result:
-            print("DID not found in database. Please register first.")
+        if private_key_path is None:
+            private_key_path = input("Provide your private_key.pem path: ")
+        token, user_did, user_data, error = start_session(private_key_path)
+        if error:
+            print(error)
             return None
-        user_data = json.loads(result[0])
-        if user_data.get("@type") not in ["Person", "Organization"]:
-            print("Only registered Persons or Organizations can register new entities.")
-            return None
-        end_time_auth = time.time()
-        total_time_auth = end_time_auth - start_time_auth
-        print()
-        print(f"It took {total_time_auth:.2f} seconds to authenticate.")
-        print()
         print(f"Welcome {user_data.get('name')}, you can now register your new Entity.")
+        print(f"Session {token_fingerprint(token)} started, valid {SESSION_TTL_SECONDS // 60} minutes.")
         return user_did
     else:
         print("Invalid choice.")
         return None
 
+# Resubmitting a document identical to one the same user registered before: "update", "reject" or "off"
+# (see content_hash.DUPLICATE_POLICIES)
+DUPLICATE_POLICY = "update"
+
+# Function to answer a resubmitted document with the DID it is already registered under
+def duplicate_result(data, existing_did, on_duplicate, output_directory=None, file_stem=None):
+    """With output_directory None the updated JSON is returned instead of saved"""
+    if on_duplicate == "reject":
+        return {"status": "error", "message": f"Identical document already registered as {existing_did}", "did_key": existing_did}
+    data["swid"] = existing_did
+    print(f"Identical document already registered as {existing_did}, nothing new to register.")
+    result = {"status": "success", "message": "Identical document already registered", "did_key": existing_did, "duplicate": True}
+    if output_directory is None:
+        result["updated_json"] = data
+    else:
+        json_output = os.path.join(output_directory, f"{file_stem or data['name'].replace(' ', '_')}.json")
+        output_writer.write_json(json_output, data)
+        result["updated_json_path"] = json_output
+    return result
+
 # Function to validate JSON and register entity
-def register_entity(json_file_path, output_directory, registered_by=None):
-    start_time_register = time.time()
-    start_time_register1 = time.time()
-    """Validates, registers, and stores an HSML entity"""
-    try:
+@registration_timer.timed("register_entity")
+def register_entity(json_file_path, output_directory, registered_by=None, overwrite=None, domain_private_key_path=None,
+                    on_duplicate=None):
+    """Validates, registers, and stores an HSML entity.
+
+    overwrite and domain_private_key_path answer the prompts ahead of time; when left as None the user is asked.
+    on_duplicate overrides DUPLICATE_POLICY.
+    """
+    with registration_timer.span("json_load"):
         with open(json_file_path, "r") as file:
-            data = json.load(file)
-    except json.JSONDecodeError:
-        return {"status": "error", "message": "Invalid JSON format"}
-    
-    # Check if JSON file is actually JSON
-    if not isinstance(data, dict):
-        return {"status": "error", "message": "Uploaded file is not a valid JSON object"}
-
-    # Check @context for HSML
-    if "@context" not in data or "https://digital-twin-interoperability.github.io/hsml-schema-context/hsml.jsonld" not in data["@context"]:
-        return {"status": "error", "message": "Not a valid HSML JSON"}
-    end_time_register1 = time.time()
-    total_time_register1 = end_time_register1 - start_time_register1
-    print()
-    print(f"It took {total_time_register1:.2f} seconds to accept the HSML JSON file.")
-    print()
+            text = file.read()
+        # Fast reject: anything that never mentions the HSML context is not worth parsing
+        if not might_be_hsml(text):
+            return {"status": "error", "message": "Not a valid HSML JSON"}
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            return {"status": "error", "message": "Invalid JSON format"}
+
+    return register_document(data, output_directory, registered_by=registered_by, overwrite=overwrite,
+                             domain_private_key_path=domain_private_key_path, on_duplicate=on_duplicate)
+
+# Function to register an HSML document that is already loaded
+@registration_timer.timed("register_document")
+def register_document(data, output_directory=None, registered_by=None, overwrite=None, domain_private_key_path=None,
+                      domain_private_key_pem=None, write_files=True, on_duplicate=None):
+    """Validates, registers, and stores an HSML entity given as a dict.
+
+    Never prompts when overwrite is a bool and a Domain key (path or PEM) is given for Credentials, so it can serve
+    requests. With write_files=False nothing is saved to output_directory and the result carries the private key
+    and updated JSON instead of their paths.
+    """
+    if on_duplicate is None:
+        on_duplicate = DUPLICATE_POLICY
+    if on_duplicate not in DUPLICATE_POLICIES:
+        raise ValueError(f"on_duplicate must be one of {DUPLICATE_POLICIES}")
+
+    # Check it is an HSML object with every required field for its type (all violations at once)
+    with registration_timer.span("validation"):
+        entity_type, errors, warnings = validate_hsml(data)
+    if errors:
+        return {"status": "error", "message": "; ".join(errors), "errors": errors}
     print("HSML JSON accepted.")
-    
-    # Check for required fields based on type
-    entity_type = data.get("@type")
-    required_fields = {
-        "Entity": ["name", "description"],
-        "Person": ["name", "birthDate", "email"],
-        "Agent": ["name", "creator", "dateCreated", "dateModified", "description"],
-        "Credential": ["name", "description", "issuedBy", "accessAuthorization", "authorizedForDomain"],
-        "Organization": ["name", "description", "url","address", "foundingDate", "email"]
-    }
-    start_time_register2 = time.time()
-    if entity_type not in required_fields:
-        return {"status": "error", "message": "Unknown or missing entity type"}
-
-    missing_fields = [field for field in required_fields[entity_type] if field not in data]
-    if missing_fields:
-        return {"status": "error", "message": f"Missing required fields: {missing_fields}"}
-
-    # Check additional conditions per type
-    if entity_type == "Person" and "affiliation" not in data:
-        print("Warning: 'affiliation' field is missing.")
-    
-    if entity_type == "Credential" and ("validFrom" not in data or "validUntil" not in data):
-        print("Warning: Credential has no expiration date.")
-
-    if entity_type == "Entity" and "linkedTo" not in data:
-        print("Warning: Object not linked to any other Entity. It will be registered under this user’s SWID.")
-    end_time_register2 = time.time()
-    total_time_register2 = end_time_register2 - start_time_register2
-    print()
-    print(f"It took {total_time_register2:.2f} seconds to generate warning for registration/check required fields.")
-    print() 
+    for warning in warnings:
+        print(f"Warning: {warning}")
 
     # Check if SWID exists in the JSON
     swid = data.get("swid")
     
     if swid:
-        start_time_register3 = time.time()
         # Check if this swid is already registered
-        db = connect_db()
-        cursor = db.cursor()
-        cursor.execute("SELECT COUNT(*) FROM did_keys WHERE did = %s", (swid,))
-        existing = cursor.fetchone()[0]
+        with registration_timer.span("swid_check"):
+            existing = storage.exists(swid)
 
         if existing:
             print(f"Warning: The provided 'swid' ({swid}) already exists in the database. You should not register an already existing object.")
-            user_input = input("Do you want to continue and overwrite the existing 'swid' property? (yes/no): ").strip().lower()
+            if overwrite is False:
+                return {"status": "error", "message": f"The provided 'swid' ({swid}) already exists in the database."}
+            if overwrite is None:
+                user_input = input("Do you want to continue and overwrite the existing 'swid' property? (yes/no): ").strip().lower()
+            else:
+                user_input = "yes"
 
             if user_input != "yes":
                 print("Process aborted. No changes were made.")
-                exit()
-        end_time_register3 = time.time()
-        total_time_register3 = end_time_register3 - start_time_register3
-        print()
-        print(f"It took {total_time_register3:.2f} seconds to check if swid already exists.")
-        print()
+                return {"status": "error", "message": "Process aborted. No changes were made."}
         print(f"Warning: SWID '{swid}' in JSON file will be overwritten.")
-        print()
+
+    # Same content already registered by this user: short-circuit to that DID, no new key, row or topic.
+    # A document that names its 'swid' is an explicit overwrite and always goes through.
+    # The row's duplicate_key is unique in the registry, so of two identical submissions racing past this check only one commits
+    content_hash = canonical_hash(data)
+    content_key = None
+    duplicate_scope = registered_by
+    if not swid and on_duplicate != "off":
+        with registration_timer.span("duplicate_check"):
+            existing_did = storage.find_duplicates([content_hash], duplicate_scope).get(content_hash)
+        if existing_did:
+            return duplicate_result(data, existing_did, on_duplicate, output_directory if write_files else None)
+        content_key = duplicate_key(content_hash, duplicate_scope)
 
     # No SWID in JSON, generate a unique one. Generate a new DID:key and private key
     did_key, private_key = generate_did_key()
@@ -231,143 +416,113 @@ def register_entity(json_file_path, output_directory, registered_by=None):
     print(f"Generated unique SWID: {did_key}")
     public_key_part = did_key.replace("did:key:", "") # Only leaves the public key part
         
-    # Connect to DB
-    db = connect_db()
-    cursor = db.cursor()
-
     # If what is being registered is a Person/Organization for the first time (when no existing user_did)
     if registered_by is None:
         registered_by = did_key
 
-    topic_name = None
-
-    # Special case: If entity is an "Agent", create a Kafka topic
-    if entity_type == "Agent":
-        flagUniqueName = False
-        while flagUniqueName == False:
-            random_suffix = generate_random_string() # new
-            topic_name = f"{data["name"].replace(" ", "_").lower()}_{random_suffix}" # new
-            #topic_name = data["name"].replace(" ", "_").lower()
-            # Check the name generated does not already exist
-            cursor.execute("SELECT COUNT(*) FROM did_keys WHERE kafka_topic = %s", (topic_name,))
-            existing_topic = cursor.fetchone()
-            if existing_topic[0]==0:
-                flagUniqueName = True
-                create_kafka_topic(topic_name)
-                send_kafka_message(topic_name, {"message": f"New Agent registered: {data['name']}"})
-
-
-    # Special case: If entity is a "Credential", more checks needed
+    # Special case: If entity is a "Credential", more checks needed (done before taking a DB connection, they may prompt)
     if entity_type == "Credential":
         issued_by_did = data.get("issuedBy", {}).get("swid") # SWID of user registering Credential
         authorized_for_domain_did = data.get("authorizedForDomain", {}).get("swid") # SWID of Domain that Credential is giving access to
         credential_domain_name = data.get("authorizedForDomain", {}).get("name") # Name of Domain that Credential is giving access to
-        access_authorization_did = data.get("accessAuthorization",{}).get("swid") # SWID of new Domain/Person/Organization that Credential is granting access authorization
         #access_authorization_type = data.get("accessAuthorization",{}).get("@type") # Type of new Domain/Person/Organization that Credential is granting access authorization
         #access_authorization_name = data.get("accessAuthorization",{}).get("name") # Name of new Domain/Person/Organization that Credential is granting access authorization
-
-        if not (issued_by_did and authorized_for_domain_did and access_authorization_did):
-            raise ValueError("Missing required 'swid' in Credential fields")
+        # The 'swid' of issuedBy, authorizedForDomain and accessAuthorization is checked by validate_hsml
 
         # Ensure issuedBy matches the logged in User's swid registering the Credential
         if issued_by_did != registered_by:
-            raise ValueError("issuedBy field must match the User registering the Credential")
+            return {"status": "error", "message": "issuedBy field must match the User registering the Credential"}
 
         # Verify authorizedForDomain ownership 
-        private_key_path_credential_domain = input(f"Provide your private_key.pem path for '{credential_domain_name}' this Credential is giving access to: ")
-        credential_domain_did = extract_did_from_private_key(private_key_path_credential_domain)
-        
+        if domain_private_key_pem is not None:
+            credential_domain_did = did_from_private_key_pem(domain_private_key_pem)
+        else:
+            private_key_path_credential_domain = domain_private_key_path
+            if private_key_path_credential_domain is None:
+                private_key_path_credential_domain = input(f"Provide your private_key.pem path for '{credential_domain_name}' this Credential is giving access to: ")
+            credential_domain_did = extract_did_from_private_key(private_key_path_credential_domain)
+    
         if credential_domain_did != authorized_for_domain_did:
             print(f"Invalid private_key.pem for '{credential_domain_name}'")
-            return None
-        
-        cursor.execute("SELECT metadata FROM did_keys WHERE did = %s", (authorized_for_domain_did,))
-        domain_did_result = cursor.fetchone()
-        if not domain_did_result:
-            print(f"DID not found in database. Please register '{credential_domain_name}' first.")
-            return None
-
-        # Update authorizedForDomain's metadata to include the new accessAuthorization swid in "canAccess"
-        domain_data = json.loads(domain_did_result[0])
-        new_access_auth = data.get("accessAuthorization", {})
-        if "canAccess" not in domain_data:
-            # Write canAccess property
-            domain_data["canAccess"] = [new_access_auth]
-            
-        else:
-            # Attach to the existing canAccess property and existing allowed_did (fetch and merge)
-            existing_can_access = domain_data.get("canAccess", [])
-            
-            # Ensure it's a list (sometimes it could be a single dict mistakenly)
-            if not isinstance(existing_can_access, list):
-                existing_can_access = [existing_can_access]
-            
-            # Extract existing swids to prevent duplicates
-            existing_swids = {entry["swid"] for entry in existing_can_access if "swid" in entry}
-
-            if new_access_auth.get("swid") and new_access_auth["swid"] not in existing_swids:
-                existing_can_access.append(new_access_auth)
-            else:
-                print(f"{new_access_auth["swid"]} arlready has access to '{credential_domain_name}'")
-            
-            # Update the JSON structure with the merged list
-            domain_data["canAccess"] = existing_can_access
-        
-        # Update Domain metadata JSON in DB and save in location
-            cursor.execute("UPDATE did_keys SET metadata = %s WHERE did = %s", (json.dumps(domain_data), authorized_for_domain_did))
-            domain_json_output = os.path.join(output_directory, f"{domain_data['name'].replace(' ', '_')}.json")
-            with open(domain_json_output, "w") as json_file:
-                json.dump(data, json_file, indent=4)
-            print(f"Updated {credential_domain_name} JSON saved to: {domain_json_output}")
-            
-        # Now to dump into allowed_did
-        # Fetch the existing allowed_did list from the database
-        cursor.execute("SELECT allowed_did FROM did_keys WHERE did = %s", (authorized_for_domain_did,))
-        allowed_did_result = cursor.fetchone()
-
-        # Convert the existing allowed_did value into a list (splitting by comma)
-        if allowed_did_result and allowed_did_result[0]:
-            allowed_did_list = allowed_did_result[0].split(",")  # Stored as comma-separated values
-        else:
-            allowed_did_list = []  # Initialize as empty list if nothing exists
+            return {"status": "error", "message": f"Invalid private_key.pem for '{credential_domain_name}'"}
 
-        # Add the new DID if it's not already present
-        new_did = new_access_auth.get("swid")
-        if new_did and new_did not in allowed_did_list:
-            allowed_did_list.append(new_did)
-
-        # Convert the list back into a comma-separated string for database storage
-        allowed_did_string = ",".join(allowed_did_list)
-
-        # Update the database with the modified allowed_did list
-        cursor.execute("UPDATE did_keys SET allowed_did = %s WHERE did = %s", 
-                    (allowed_did_string, authorized_for_domain_did))
+    # Special case: If entity is an "Agent", give it a Kafka topic (the outbox relay creates it if needed).
+    # Taken before the transaction, as the pool never waits; it gets the topic back if the registration does not commit
+    topic_name = None
+    create_topic = False
+    if entity_type == "Agent":
+        topic_name, create_topic = new_agent_topic(data["name"], did_key)
 
-    # Store in MySQL
-    cursor.execute(
-        "REPLACE INTO did_keys (did, public_key, metadata, registered_by, kafka_topic) VALUES (%s, %s, %s, %s, %s)",
-        (did_key, public_key_part, json.dumps(data), registered_by, topic_name)
-    )
-    db.commit()
-    db.close()
+    # Everything below runs in one transaction on a pooled connection, committed when the block exits
+    committed = False
+    try:
+        with registration_timer.span("db_write"), db_cursor() as cursor:
+            domain_data = None
+
+            if topic_name is not None:
+                storage.enqueue_messages([agent_announcement(topic_name, data["name"], create_topic)], cursor=cursor)
+
+            # Credential: the ownership checks above passed, now update the Domain's access
+            if entity_type == "Credential":
+                if not storage.exists(authorized_for_domain_did, cursor=cursor):
+                    print(f"DID not found in database. Please register '{credential_domain_name}' first.")
+                    return {"status": "error", "message": f"DID not found in database. Please register '{credential_domain_name}' first."}
+
+                # Append the new accessAuthorization to the Domain's "canAccess": one insert into domain_access,
+                # no read-modify-write of the Domain's metadata blob, so concurrent grants cannot overwrite each other
+                new_access_auth = data.get("accessAuthorization", {})
+                if storage.grant_access(authorized_for_domain_did, new_access_auth["swid"], access_entry=new_access_auth, cursor=cursor):
+                    # The Domain's JSON with its full canAccess list is saved once the transaction commits
+                    domain_data = storage.get_metadata(authorized_for_domain_did, cursor=cursor)
+                else:
+                    print(f"{new_access_auth['swid']} already has access to '{credential_domain_name}'")
+
+            # Store in MySQL
+            storage.insert(did_key, public_key_part, data, registered_by, topic_name, content_hash, content_key, cursor=cursor)
+            registry_filter.add(did_key, topic_name)
+        committed = True
+    except Exception:
+        # Lost the race to an identical submission: answer with the DID that won, as the check above would have
+        existing_did = storage.find_duplicates([content_hash], duplicate_scope).get(content_hash) if content_key else None
+        if not existing_did:
+            raise
+        data.pop("swid", None)
+        return duplicate_result(data, existing_did, on_duplicate, output_directory if write_files else None)
+    finally:
+        if not committed:
+            release_agent_topic(topic_name, create_topic)
+
+    if topic_name is not None:
+        outbox_relay.wake()
+
+    if domain_data is not None and write_files:
+        domain_json_output = os.path.join(output_directory, f"{domain_data['name'].replace(' ', '_')}.json")
+        output_writer.write_json(domain_json_output, domain_data)
+        print(f"Updated {credential_domain_name} JSON saved to: {domain_json_output}")
+
+    if not write_files:
+        return {
+            "status": "success",
+            "message": "Entity registered successfully",
+            "did_key": did_key,
+            "private_key": private_key,
+            "updated_json": data
+        }
 
     # Ask user where to save files
     private_key_output = os.path.join(output_directory, "private_key.pem")
     json_output = os.path.join(output_directory, f"{data['name'].replace(' ', '_')}.json")
 
-    # Save private key file (there was an error here, had to modify to this)
-    with open(private_key_output, "w") as private_key_file:
-        private_key_file.write(private_key)
-
-    # Save JSON file
-    with open(json_output, "w") as json_file:
-        json.dump(data, json_file, indent=4)
+    with registration_timer.span("file_write"):
+        # Save private key file (owner-only permissions) now and the JSON file in the background
+        try:
+            output_writer.write_private_key(private_key_output, private_key)
+        except OSError as e:
+            # Registered already: hand the key back rather than lose it
+            return {"status": "error", "message": f"Registered as {did_key} but the private key could not be saved: {e}",
+                    "did_key": did_key, "private_key": private_key}
+        output_writer.write_json(json_output, data)
 
-    end_time_register = time.time()
-    total_time_register = end_time_register - start_time_register
-    print()
-    print(f"It took {total_time_register:.2f} seconds to register.")
-    print()
     print(f"Private key saved to: {private_key_output}")
     print(f"Updated JSON saved to: {json_output}")
 
@@ -379,20 +534,333 @@ def register_entity(json_file_path, output_directory, registered_by=None):
         "updated_json_path": json_output
     }
 
+# Number of entities written per transaction by register_entities
+BULK_CHUNK_SIZE = 500
+
+# Function to read HSML documents from a directory of JSON files or an NDJSON stream
+def load_hsml_documents(source):
+    """Yields (source_label, data, error_message) for a directory of .json files, an NDJSON file, or '-' for NDJSON on stdin"""
+    if source != "-" and os.path.isdir(source):
+        for file_name in sorted(os.listdir(source)):
+            if not file_name.lower().endswith(".json"):
+                continue
+            json_file_path = os.path.join(source, file_name)
+            try:
+                with open(json_file_path, "r") as file:
+                    yield json_file_path, json.load(file), None
+            except json.JSONDecodeError:
+                yield json_file_path, None, "Invalid JSON format"
+        return
+
+    stream = sys.stdin if source == "-" else open(source, "r")
+    try:
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            label = f"{source}:{line_number}"
+            if not might_be_hsml(line):
+                yield label, None, "Not a valid HSML JSON"
+                continue
+            try:
+                yield label, json.loads(line), None
+            except json.JSONDecodeError:
+                yield label, None, "Invalid JSON format"
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+# Function to get several unique DID:keys with batched uniqueness checks
+def generate_unique_did_keys(count, workers=None):
+    """Returns a list of `count` (did_key, private_key_pem) pairs not yet in the registry.
+
+    Large batches are generated in parallel on `workers` processes (defaults to the number of cores).
+    """
+    key_pairs = {}
+    while len(key_pairs) < count:
+        missing = count - len(key_pairs)
+        # More than one worker chunk: generate them on worker processes instead of draining the key pool
+        if missing > KEYGEN_CHUNK_SIZE:
+            candidates = dict(generate_did_key_pairs(missing, workers=workers))
+        else:
+            candidates = dict(key_pool.get() for _ in range(missing))
+        for did_key in key_pairs.keys() & candidates.keys():
+            del candidates[did_key]
+        maybe_taken = maybe_registered("did", candidates)
+        for did_key in storage.existing("did", maybe_taken):
+            del candidates[did_key]
+        key_pairs.update(candidates)
+    return list(key_pairs.items())
+
+# Function to register many HSML entities at once
+def register_entities(source, output_directory, registered_by=None, chunk_size=BULK_CHUNK_SIZE, overwrite=False, on_duplicate=None,
+                      keygen_workers=None):
+    """Validates every document first, then writes them with executemany in one transaction per chunk.
+
+    Returns one result dict per document, in input order. Credentials are rejected because they need
+    the Domain's private key; register them one at a time with register_entity.
+    """
+    if on_duplicate is None:
+        on_duplicate = DUPLICATE_POLICY
+    if on_duplicate not in DUPLICATE_POLICIES:
+        raise ValueError(f"on_duplicate must be one of {DUPLICATE_POLICIES}")
+    results = []
+    accepted = []  # (result, data) pairs that passed validation
+
+    # Validate the whole batch before touching the registry
+    for label, data, error in load_hsml_documents(source):
+        result = {"source": label, "status": "error"}
+        results.append(result)
+        if error is None:
+            with registration_timer.span("validation"):
+                entity_type, errors, _ = validate_hsml(data)
+            if errors:
+                error = "; ".join(errors)
+                result["errors"] = errors
+        if error is None:
+            if entity_type == "Credential":
+                error = "Credentials must be registered individually with register_entity"
+            elif registered_by is None and entity_type not in ["Person", "Organization"]:
+                error = "You can only register a Person or Organization as a new user."
+        if error:
+            result["message"] = error
+        else:
+            accepted.append((result, data))
+
+    # Documents that carry an already registered 'swid' need an explicit overwrite
+    provided_swids = {data["swid"] for _, data in accepted if data.get("swid")}
+    if provided_swids and not overwrite:
+        existing_swids = storage.existing("did", provided_swids, chunk_size=chunk_size)
+        if existing_swids:
+            still_accepted = []
+            for result, data in accepted:
+                if data.get("swid") in existing_swids:
+                    result["message"] = f"The provided 'swid' ({data['swid']}) already exists in the database. Use overwrite to register it again."
+                else:
+                    still_accepted.append((result, data))
+            accepted = still_accepted
+
+    # Documents identical to one this user already registered, or to an earlier one in this batch
+    batch_duplicates = []  # (result, result of the first identical document)
+    if on_duplicate != "off":
+        content_hashes = [None if data.get("swid") else canonical_hash(data) for _, data in accepted]
+        with registration_timer.span("duplicate_check"):
+            registered = storage.find_duplicates({content_hash for content_hash in content_hashes if content_hash}, registered_by)
+        first_in_batch = {}
+        still_accepted = []
+        for (result, data), content_hash in zip(accepted, content_hashes):
+            if content_hash in registered:
+                existing_did = registered[content_hash]
+                result.update(duplicate_result(data, existing_did, on_duplicate, output_directory,
+                                               file_stem=f"{data['name'].replace(' ', '_')}_{existing_did[-8:]}"))
+            elif content_hash in first_in_batch:
+                if on_duplicate == "reject":
+                    result["message"] = f"Identical to {first_in_batch[content_hash]['source']} in this batch"
+                else:
+                    batch_duplicates.append((result, first_in_batch[content_hash]))
+            else:
+                if content_hash:
+                    first_in_batch[content_hash] = result
+                still_accepted.append((result, data))
+        accepted = still_accepted
+
+    if not accepted:
+        return results
+
+    with registration_timer.span("bulk_key_generation"):
+        key_pairs = generate_unique_did_keys(len(accepted), workers=keygen_workers)
+    agent_indexes = [i for i, (_, data) in enumerate(accepted) if data["@type"] == "Agent"]
+    if AGENT_TOPIC_MODE == "shared":
+        pooled_topics = set()
+        agent_topics = {i: shared_agent_topics.address_for(key_pairs[i][0]) for i in agent_indexes}
+    else:
+        # Pre-created topics first, then topics named after the DID (created by the outbox relay) for the rest
+        pooled_topics = topic_pool.acquire_many(len(agent_indexes)) if agent_indexes else []
+        agent_topics = dict(zip(agent_indexes, pooled_topics))
+        unpooled_indexes = agent_indexes[len(pooled_topics):]
+        agent_topics.update((i, agent_topic_name(accepted[i][1]["name"], key_pairs[i][0])) for i in unpooled_indexes)
+        pooled_topics = set(pooled_topics)
+
+    # Documents checked for duplicates above carry a duplicate_key, unique in the registry, so one submitted
+    # at the same time by another request cannot be registered twice
+    content_hashes = [canonical_hash(data) for _, data in accepted]
+    content_keys = [None if on_duplicate == "off" or data.get("swid") else duplicate_key(content_hash, registered_by)
+                    for (_, data), content_hash in zip(accepted, content_hashes)]
+
+    for start in range(0, len(accepted), chunk_size):
+        chunk = list(range(start, min(start + chunk_size, len(accepted))))
+        while chunk:
+            rows = []
+            for i in chunk:
+                data = accepted[i][1]
+                did_key = key_pairs[i][0]
+                data["swid"] = did_key # Attach new DID:key to swid
+                rows.append((did_key, did_key.replace("did:key:", ""), data, registered_by or did_key, agent_topics.get(i),
+                             content_hashes[i], content_keys[i]))
+
+            # Announcements (and the topics the pool could not cover) go out through the outbox once the chunk commits
+            announcements = [agent_announcement(agent_topics[i], accepted[i][1]["name"], agent_topics[i] not in pooled_topics)
+                             for i in chunk if i in agent_topics]
+            try:
+                with registration_timer.span("bulk_db_write"), db_cursor() as cursor:
+                    storage.insert_many(rows, cursor=cursor)
+                    storage.enqueue_messages(announcements, cursor=cursor)
+                for row in rows:
+                    registry_filter.add(row[0], row[4])
+                break
+            except Exception as e:
+                failure = e
+
+            # Documents an identical submission registered meanwhile get that DID, the rest of the chunk is tried again
+            try:
+                raced = storage.find_duplicates({content_hashes[i] for i in chunk if content_keys[i]}, registered_by)
+            except Exception:
+                raced = {}
+            remaining = []
+            for i in chunk:
+                result, data = accepted[i]
+                existing_did = raced.get(content_hashes[i]) if content_keys[i] else None
+                if existing_did:
+                    result.update(duplicate_result(data, existing_did, on_duplicate, output_directory,
+                                                   file_stem=f"{data['name'].replace(' ', '_')}_{existing_did[-8:]}"))
+                elif raced:
+                    remaining.append(i)
+                    continue
+                else:
+                    result["message"] = f"Registration failed: {failure}"
+                if agent_topics.get(i) in pooled_topics:
+                    topic_pool.release(agent_topics[i])  # Not assigned after all: hand it to the next Agent
+            chunk = remaining
+        if not chunk:
+            continue
+
+        # Chunk committed: publish the announcements and save the files
+        if announcements:
+            outbox_relay.wake()
+        for i in chunk:
+            result, data = accepted[i]
+            did_key, private_key = key_pairs[i]
+
+            # Every entity in a batch gets its own files, so suffix them with the end of its DID
+            file_stem = f"{data['name'].replace(' ', '_')}_{did_key[-8:]}"
+            private_key_output = os.path.join(output_directory, f"{file_stem}_private_key.pem")
+            json_output = os.path.join(output_directory, f"{file_stem}.json")
+            with registration_timer.span("file_write"):
+                try:
+                    output_writer.write_private_key(private_key_output, private_key)
+                except OSError as e:
+                    result.update({"message": f"Registered as {did_key} but the private key could not be saved: {e}",
+                                   "did_key": did_key, "private_key": private_key})
+                    continue
+                output_writer.write_json(json_output, data)
+
+            result.update({
+                "status": "success",
+                "message": "Entity registered successfully",
+                "did_key": did_key,
+                "private_key_path": private_key_output,
+                "updated_json_path": json_output
+            })
+
+    # Identical documents later in the batch share the first one's registration
+    for result, first_result in batch_duplicates:
+        if first_result["status"] == "success":
+            result.update({
+                "status": "success",
+                "message": "Identical to an earlier document in this batch",
+                "did_key": first_result["did_key"],
+                "duplicate": True,
+                "updated_json_path": first_result["updated_json_path"]
+            })
+        else:
+            result["message"] = first_result["message"]
+
+    return results
+
 # Example usage
 if __name__ == "__main__":
-    user_did = login_or_register()
+    parser = argparse.ArgumentParser(description="Register HSML entities in the DID registry")
+    parser.add_argument("--batch", metavar="SOURCE", help="Bulk mode: a directory of HSML JSON files, an NDJSON file, or '-' for NDJSON on stdin")
+    parser.add_argument("--login-key", help="Bulk mode: private_key.pem of the registered Person/Organization registering the batch")
+    parser.add_argument("--session-token", default=os.environ.get("REGISTRATION_SESSION_TOKEN"),
+                        help="Log in with a session token from an earlier login instead of a private key")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIRECTORY, help="Directory to save the private keys and updated JSON files")
+    parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE, help="Bulk mode: entities written per transaction")
+    parser.add_argument("--keygen-workers", type=int, help="Bulk mode: processes generating DID:keys for large batches (defaults to the number of cores)")
+    parser.add_argument("--overwrite", action="store_true", help="Bulk mode: register documents whose 'swid' already exists")
+    parser.add_argument("--timings-out", help="Write per-stage latency histograms on exit (.prom for Prometheus text, JSON otherwise)")
+    parser.add_argument("--on-duplicate", choices=DUPLICATE_POLICIES, default=DUPLICATE_POLICY,
+                        help="Documents identical to one already registered by the same user: reuse its DID (update), reject them, or register them again (off)")
+    parser.add_argument("--compact-json", action="store_true", help="Save the updated JSON files without indentation")
+    parser.add_argument("--agent-topic-mode", choices=AGENT_TOPIC_MODES, default=AGENT_TOPIC_MODE,
+                        help="Give each new Agent its own Kafka topic (dedicated) or a DID key on a shared partitioned topic (shared)")
+    parser.add_argument("--message-codec", choices=list(CODECS), default=KAFKA_MESSAGE_CODEC, help="Encoding of the Kafka messages sent")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"], default=REGISTRY_BACKEND, help="Registry storage backend")
+    parser.add_argument("--sqlite-path", default=REGISTRY_SQLITE_PATH, help="Registry file for the sqlite backend")
+    parser.add_argument("--migrate", action="store_true", help="Create missing registry tables and indexes, move allowed_did and canAccess values into domain_access, rebuild the access closure, then exit")
+    args = parser.parse_args()
+
+    if (args.backend, args.sqlite_path) != (REGISTRY_BACKEND, REGISTRY_SQLITE_PATH):
+        storage.close()
+        storage = open_storage(args.backend, mysql_config=db_config, sqlite_path=args.sqlite_path, pool_size=DB_POOL_SIZE)
+        outbox_relay.storage = storage
+
+    if args.migrate:
+        migrated = storage.migrate()
+        print(f"Registry schema is up to date ({migrated['allowed_did_grants']} allowed_did grants copied to domain_access, "
+              f"{migrated['can_access_entries']} canAccess entries moved out of metadata, {migrated['content_hashes']} content hashes filled in, "
+              f"{migrated['indexed_entities']} entities indexed for queries, {migrated['access_closure_pairs']} access closure pairs).")
+        sys.exit(0)
+    if args.timings_out:
+        atexit.register(registration_timer.write, args.timings_out)
+    output_writer.compact = args.compact_json
+    get_codec(args.message_codec)  # Fails now, not in the outbox relay, when the codec's package is missing
+    KAFKA_MESSAGE_CODEC = args.message_codec
+    AGENT_TOPIC_MODE = args.agent_topic_mode
+    DUPLICATE_POLICY = args.on_duplicate
+    if AGENT_TOPIC_MODE == "dedicated":
+        topic_pool.start()  # Reclaims leftover pooled topics and fills the pool in the background
+
+    if args.batch:
+        registered_by = None
+        if args.session_token:
+            session = session_user(args.session_token)
+            if session is None:
+                print("Session expired or invalid, please log in again.")
+                sys.exit(1)
+            registered_by = session[0]
+        elif args.login_key:
+            token, registered_by, _, error = start_session(args.login_key)
+            if error:
+                print(error)
+                sys.exit(1)
+            print(f"Session {token_fingerprint(token)} started, valid {SESSION_TTL_SECONDS // 60} minutes.", file=sys.stderr)
+        os.makedirs(args.output_dir, exist_ok=True)
+        results = register_entities(args.batch, args.output_dir, registered_by=registered_by, chunk_size=args.chunk_size, overwrite=args.overwrite,
+                                    keygen_workers=args.keygen_workers)
+        for result in results:
+            print(json.dumps(result))
+        registered = sum(1 for result in results if result["status"] == "success")
+        print(f"Registered {registered} of {len(results)} entities.", file=sys.stderr)
+        try:
+            output_writer.flush()
+        except OutputWriteError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0 if registered == len(results) else 1)
+
+    user_did = login_or_register(session_token=args.session_token)
     #json_file_path = "C:/Users/nnamian/OneDrive - JPL/Desktop/Digital Twin Interoperability/Codes/HSML Examples/Examples 2025-02-03/entityExample/entityExample.json"  # Provide your JSON file
     if user_did is not None:
         json_file_path = input("Enter the directory to your HSML JSON to be registered: ")
         #output_directory = input("Enter the directory to save the private key and updated JSON: ")
-        output_directory = "C:/Users/nnamian/OneDrive - JPL/Desktop/Digital Twin Interoperability/Codes/HSML Examples/registeredExamples"
+        output_directory = args.output_dir
 
         if not os.path.exists(output_directory):
             os.makedirs(output_directory)
 
         result = register_entity(json_file_path, output_directory, registered_by=user_did)
         print(result)
+        output_writer.flush()
     else:
         while True:
             json_file_path = input("Enter the directory to your Person/Organization HSML JSON to be registered: ")
@@ -411,10 +879,11 @@ if __name__ == "__main__":
                 continue
             break
 
-        output_directory = "C:/Users/nnamian/OneDrive - JPL/Desktop/Digital Twin Interoperability/Codes/HSML Examples/registeredExamples"
+        output_directory = args.output_dir
         if not os.path.exists(output_directory):
             os.makedirs(output_directory)
         
         result = register_entity(json_file_path, output_directory, registered_by=None)
         print(result)
+        output_writer.flush()
 
@@ -0,0 +1,181 @@
+import json
+
+# Access grants live in domain_access(domain_did, grantee_did), one row per grant with a
+# composite primary key: granting is a single insert and checking a single index lookup.
+# The row also keeps the accessAuthorization object, so a Domain's canAccess list is
+# appended to here instead of being rewritten inside its did_keys.metadata blob.
+
+# Function to give a DID access to a Domain
+def grant_access(cursor, domain_did, grantee_did, access_entry=None):
+    """Returns True if the grant is new, False if the DID already had access.
+
+    access_entry is the accessAuthorization object to list in the Domain's canAccess. A new grant
+    is added to access_closure in the same transaction.
+    """
+    cursor.execute(
+        "INSERT IGNORE INTO domain_access (domain_did, grantee_did, access_entry) VALUES (%s, %s, %s)",
+        (domain_did, grantee_did, json.dumps(access_entry) if access_entry is not None else None)
+    )
+    if cursor.rowcount != 1:
+        return False
+    extend_access_closure(cursor, domain_did, grantee_did)
+    return True
+
+# Function to grant many (domain_did, grantee_did) or (domain_did, grantee_did, access_entry) tuples at once
+def grant_access_bulk(cursor, grants):
+    rows = []
+    for grant in grants:
+        access_entry = grant[2] if len(grant) > 2 else None
+        rows.append((grant[0], grant[1], json.dumps(access_entry) if access_entry is not None else None))
+    cursor.executemany("INSERT IGNORE INTO domain_access (domain_did, grantee_did, access_entry) VALUES (%s, %s, %s)", rows)
+    for domain_did, grantee_did, _ in rows:
+        extend_access_closure(cursor, domain_did, grantee_did)
+
+# Function to take a DID's access to a Domain away
+def revoke_access(cursor, domain_did, grantee_did):
+    """Returns True if a grant was removed"""
+    cursor.execute("DELETE FROM domain_access WHERE domain_did = %s AND grantee_did = %s", (domain_did, grantee_did))
+    if cursor.rowcount != 1:
+        return False
+    recompute_access_closure(cursor, closure_sources(cursor, [domain_did]))
+    return True
+
+# Function to revoke many (domain_did, grantee_did) pairs at once
+def revoke_access_bulk(cursor, grants):
+    grants = list(grants)
+    cursor.executemany("DELETE FROM domain_access WHERE domain_did = %s AND grantee_did = %s", grants)
+    recompute_access_closure(cursor, closure_sources(cursor, {domain_did for domain_did, _ in grants}))
+
+# Function to check whether a DID has access to a Domain
+def has_access(cursor, domain_did, grantee_did):
+    cursor.execute("SELECT 1 FROM domain_access WHERE domain_did = %s AND grantee_did = %s LIMIT 1", (domain_did, grantee_did))
+    return cursor.fetchone() is not None
+
+# Function to list every DID with access to a Domain
+def list_grantees(cursor, domain_did):
+    cursor.execute("SELECT grantee_did FROM domain_access WHERE domain_did = %s ORDER BY grantee_did", (domain_did,))
+    return [row[0] for row in cursor.fetchall()]
+
+# Function to list every Domain a DID has access to
+def list_domains(cursor, grantee_did):
+    cursor.execute("SELECT domain_did FROM domain_access WHERE grantee_did = %s ORDER BY domain_did", (grantee_did,))
+    return [row[0] for row in cursor.fetchall()]
+
+# Function to list a Domain's canAccess entries, oldest grant first
+def can_access_entries(cursor, domain_did):
+    cursor.execute(
+        "SELECT grantee_did, access_entry FROM domain_access WHERE domain_did = %s ORDER BY granted_at, grantee_did",
+        (domain_did,)
+    )
+    return [json.loads(access_entry) if access_entry else {"swid": grantee_did} for grantee_did, access_entry in cursor.fetchall()]
+
+# Function to load a DID's metadata with its canAccess list rebuilt from domain_access
+def load_metadata(cursor, did):
+    """Returns the metadata dict, or None if the DID is not registered"""
+    cursor.execute("SELECT metadata FROM did_keys WHERE did = %s", (did,))
+    result = cursor.fetchone()
+    if not result:
+        return None
+    data = json.loads(result[0])
+    entries = can_access_entries(cursor, did)
+    if entries:
+        existing = data.get("canAccess", [])
+        data["canAccess"] = (existing if isinstance(existing, list) else [existing]) + entries
+    return data
+
+
+# access_closure holds every (domain_did, grantee_did) pair joined by a chain of grants: the
+# grantee of a Domain's grant can itself be a Domain that granted access further. Whether a
+# DID reaches a Domain through delegated Credentials is then one primary key lookup instead
+# of a graph walk. A new grant adds its pairs in the registration's transaction; a revocation
+# recomputes the Domains upstream of it; recompute_access_closure() rebuilds the whole table.
+
+# DIDs per IN (...) query while walking grants
+CLOSURE_CHUNK_SIZE = 500
+
+# Function to check whether a DID reaches a Domain through one or more grants
+def can_reach(cursor, domain_did, grantee_did):
+    cursor.execute("SELECT 1 FROM access_closure WHERE domain_did = %s AND grantee_did = %s LIMIT 1", (domain_did, grantee_did))
+    return cursor.fetchone() is not None
+
+# Function to list every Domain a DID reaches through one or more grants
+def reachable_domains(cursor, grantee_did):
+    cursor.execute("SELECT domain_did FROM access_closure WHERE grantee_did = %s ORDER BY domain_did", (grantee_did,))
+    return [row[0] for row in cursor.fetchall()]
+
+# Function to add the pairs a new grant creates to access_closure
+def extend_access_closure(cursor, domain_did, grantee_did):
+    """Everything that reaches domain_did now also reaches what grantee_did reaches, and grantee_did itself.
+
+    The two reads lock their index ranges (FOR UPDATE) so that two Credentials registered at
+    once cannot each miss the pairs the other one adds. Returns the number of pairs added.
+    """
+    cursor.execute("SELECT domain_did FROM access_closure WHERE grantee_did = %s FOR UPDATE", (domain_did,))
+    upstream = [domain_did] + [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT grantee_did FROM access_closure WHERE domain_did = %s FOR UPDATE", (grantee_did,))
+    downstream = [grantee_did] + [row[0] for row in cursor.fetchall()]
+    pairs = [(domain, grantee) for domain in upstream for grantee in downstream if domain != grantee]
+    for start in range(0, len(pairs), CLOSURE_CHUNK_SIZE):
+        cursor.executemany("INSERT IGNORE INTO access_closure (domain_did, grantee_did) VALUES (%s, %s)", pairs[start:start + CLOSURE_CHUNK_SIZE])
+    return len(pairs)
+
+# Function to find the Domains whose closure depends on the grants of the given Domains
+def closure_sources(cursor, domain_dids):
+    """The given Domains and every Domain that reaches one of them"""
+    sources = set(domain_dids)
+    domain_dids = list(sources)
+    for start in range(0, len(domain_dids), CLOSURE_CHUNK_SIZE):
+        chunk = domain_dids[start:start + CLOSURE_CHUNK_SIZE]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(f"SELECT domain_did FROM access_closure WHERE grantee_did IN ({placeholders})", chunk)
+        sources.update(row[0] for row in cursor.fetchall())
+    return sources
+
+# Function to read the grants of the given Domains into an adjacency dict
+def _load_grants(cursor, domain_dids, grants):
+    domain_dids = [did for did in domain_dids if did not in grants]
+    for did in domain_dids:
+        grants[did] = []
+    for start in range(0, len(domain_dids), CLOSURE_CHUNK_SIZE):
+        chunk = domain_dids[start:start + CLOSURE_CHUNK_SIZE]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(f"SELECT domain_did, grantee_did FROM domain_access WHERE domain_did IN ({placeholders})", chunk)
+        for domain_did, grantee_did in cursor.fetchall():
+            grants[domain_did].append(grantee_did)
+
+# Function to rebuild access_closure from domain_access
+def recompute_access_closure(cursor, domain_dids=None):
+    """Rebuilds the rows of the given Domains (after a revocation), or the whole table when domain_dids is None.
+
+    Walks the grants breadth first from each Domain, reading each level with one query, or with a
+    single scan of domain_access for a full rebuild. Returns the number of pairs written.
+    """
+    grants = {}
+    if domain_dids is None:
+        cursor.execute("SELECT domain_did, grantee_did FROM domain_access")
+        for domain_did, grantee_did in cursor.fetchall():
+            grants.setdefault(domain_did, []).append(grantee_did)
+        cursor.execute("DELETE FROM access_closure")
+        sources = list(grants)
+    else:
+        sources = list(domain_dids)
+        for start in range(0, len(sources), CLOSURE_CHUNK_SIZE):
+            chunk = sources[start:start + CLOSURE_CHUNK_SIZE]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(f"DELETE FROM access_closure WHERE domain_did IN ({placeholders})", chunk)
+
+    written = 0
+    for source in sources:
+        reached = set()
+        frontier = [source]
+        while frontier:
+            if domain_dids is not None:
+                _load_grants(cursor, frontier, grants)
+            frontier = [grantee for did in frontier for grantee in grants.get(did, ()) if grantee not in reached and grantee != source]
+            frontier = list(dict.fromkeys(frontier))
+            reached.update(frontier)
+        pairs = [(source, grantee) for grantee in reached]
+        for start in range(0, len(pairs), CLOSURE_CHUNK_SIZE):
+            cursor.executemany("INSERT INTO access_closure (domain_did, grantee_did) VALUES (%s, %s)", pairs[start:start + CLOSURE_CHUNK_SIZE])
+        written += len(pairs)
+    return written
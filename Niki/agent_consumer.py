@@ -0,0 +1,259 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+from confluent_kafka import Consumer, KafkaError, KafkaException
+from agent_topics import parse_topic_address
+from message_codec import decode_kafka_message
+
+# What a subscriber receives. `message` is decoded once and shared by every subscriber of the
+# Agent, so treat it as read-only.
+AgentMessage = namedtuple("AgentMessage", "address topic key partition offset timestamp message schema schema_version")
+
+OVERFLOW_POLICIES = ("block", "drop")
+
+
+class Subscription:
+    """One in-process subscriber to an Agent's topic address, fed through a bounded queue.
+
+    With overflow "block" a full queue holds the consumer back (every subscriber waits for the
+    slowest); with "drop" the message is counted in `dropped` and skipped for this subscriber
+    only. Read with get(), iterate, or pass a callback to have a thread of its own call it.
+    """
+
+    def __init__(self, address, queue_size=1000, overflow="block", callback=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow} (expected one of {', '.join(OVERFLOW_POLICIES)})")
+        self.address = address
+        self.topic, self.key = parse_topic_address(address)
+        self.overflow = overflow
+        self.callback = callback
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.delivered = 0
+        self.dropped = 0
+        self.callback_errors = 0
+        self.closed = threading.Event()
+        self._thread = None
+        if callback is not None:
+            self._thread = threading.Thread(target=self._callback_loop, name=f"agent-subscriber-{self.topic}", daemon=True)
+            self._thread.start()
+
+    def get(self, timeout=None):
+        """Returns the next AgentMessage, or None when none arrives within `timeout` seconds"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def __iter__(self):
+        while not self.closed.is_set() or not self.queue.empty():
+            item = self.get(timeout=0.1)
+            if item is not None:
+                yield item
+
+    def _put(self, item, stopped):
+        if self.overflow == "drop":
+            try:
+                self.queue.put_nowait(item)
+                self.delivered += 1
+            except queue.Full:
+                self.dropped += 1
+            return
+        # Block, but give up once the consumer or this subscription is closed
+        while not stopped.is_set() and not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                self.delivered += 1
+                return
+            except queue.Full:
+                continue
+
+    def _callback_loop(self):
+        for item in self:
+            try:
+                self.callback(item)
+            except Exception as e:
+                self.callback_errors += 1
+                print(f"Subscriber of '{self.address}' failed: {e}")
+
+    def close(self):
+        self.closed.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def stats(self):
+        return {"address": self.address, "queued": self.queue.qsize(), "delivered": self.delivered,
+                "dropped": self.dropped, "callback_errors": self.callback_errors}
+
+
+class AgentConsumer:
+    """One Kafka consumer per process, fanning Agent messages out to any number of in-process subscribers.
+
+    A single thread consumes up to `batch_size` messages per call across every subscribed topic,
+    decodes each message once (message_codec) and puts it on the queue of each Subscription
+    for its topic address: a dedicated topic, or a shared topic and DID key (agent_topics).
+    Messages keyed for Agents nobody here subscribed to are skipped without decoding.
+
+    Offsets are committed asynchronously, at most every `commit_interval` seconds, once a batch
+    is on the subscribers' queues, and synchronously on close(): a message still queued when the
+    process dies is not redelivered.
+    """
+
+    def __init__(self, config=None, group_id="hsml-agent-consumer", consumer=None, batch_size=500, poll_timeout=0.5,
+                 commit_interval=1.0, queue_size=1000):
+        if consumer is None:
+            consumer_config = dict(config or {})
+            consumer_config.setdefault("group.id", group_id)
+            consumer_config.setdefault("auto.offset.reset", "latest")
+            consumer_config["enable.auto.commit"] = False
+            consumer_config["on_commit"] = self._on_commit
+            consumer = Consumer(consumer_config)
+        self._consumer = consumer
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.commit_interval = commit_interval
+        self.queue_size = queue_size
+        self._routes = {}  # topic -> {key or None: [Subscription, ...]}
+        self._lock = threading.Lock()
+        self._resubscribe = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._last_commit = time.monotonic()
+        self._uncommitted = False
+        self.consumed = 0
+        self.skipped = 0
+        self.decode_errors = 0
+        self.batches = 0
+        self.commits = 0
+        self.commit_errors = 0
+        self.last_error = None
+
+    def subscribe(self, address, queue_size=None, overflow="block", callback=None):
+        """Starts delivering the messages of an Agent's topic address; returns its Subscription"""
+        subscription = Subscription(address, queue_size=queue_size or self.queue_size, overflow=overflow, callback=callback)
+        with self._lock:
+            self._routes.setdefault(subscription.topic, {}).setdefault(subscription.key, []).append(subscription)
+        self._resubscribe.set()
+        if self._thread is None:
+            self.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            keys = self._routes.get(subscription.topic, {})
+            subscribers = keys.get(subscription.key, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+            if not subscribers:
+                keys.pop(subscription.key, None)
+            if not keys:
+                self._routes.pop(subscription.topic, None)
+        self._resubscribe.set()
+        subscription.close()
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._consume_loop, name="agent-consumer", daemon=True)
+            self._thread.start()
+        return self
+
+    def _on_commit(self, err, partitions):
+        if err is not None:
+            self.commit_errors += 1
+            self.last_error = f"Offset commit failed: {err}"
+
+    def _deliver(self, routes, msg):
+        keys = routes.get(msg.topic(), {})
+        key = msg.key()
+        key = key.decode("utf-8", errors="replace") if isinstance(key, bytes) else key
+        # Subscribers of the whole topic, then those of this message's Agent on a shared topic
+        targets = keys.get(None, []) + (keys.get(key, []) if key is not None else [])
+        if not targets:
+            self.skipped += 1
+            return
+        try:
+            message, schema, schema_version = decode_kafka_message(msg)
+        except Exception as e:
+            self.decode_errors += 1
+            self.last_error = f"Undecodable message at {msg.topic()}[{msg.partition()}]@{msg.offset()}: {e}"
+            return
+        timestamp = msg.timestamp()[1] if msg.timestamp() else None
+        for subscription in targets:
+            subscription._put(AgentMessage(subscription.address, msg.topic(), key, msg.partition(), msg.offset(), timestamp,
+                                           message, schema, schema_version), self._stopped)
+
+    def _consume_loop(self):
+        while not self._stopped.is_set():
+            if self._resubscribe.is_set():
+                self._resubscribe.clear()
+                with self._lock:
+                    topics = list(self._routes)
+                try:
+                    if topics:
+                        self._consumer.subscribe(topics)
+                    else:
+                        self._consumer.unsubscribe()
+                except Exception as e:
+                    self.last_error = f"Subscribe failed: {e}"
+            with self._lock:
+                routes = {topic: {key: list(subscribers) for key, subscribers in keys.items()} for topic, keys in self._routes.items()}
+            if not routes:
+                self._resubscribe.wait(self.poll_timeout)
+                continue
+
+            try:
+                messages = self._consumer.consume(self.batch_size, self.poll_timeout)
+            except Exception as e:
+                self.last_error = str(e)
+                time.sleep(self.poll_timeout)
+                continue
+            if messages:
+                self.batches += 1
+            for msg in messages:
+                error = msg.error()
+                if error is not None:
+                    if error.code() != KafkaError._PARTITION_EOF:
+                        self.last_error = str(error)
+                    continue
+                self.consumed += 1
+                self._uncommitted = True
+                self._deliver(routes, msg)
+            self._commit(asynchronous=True)
+
+    def _commit(self, asynchronous=True, force=False):
+        if not self._uncommitted or (not force and time.monotonic() - self._last_commit < self.commit_interval):
+            return
+        try:
+            self._consumer.commit(asynchronous=asynchronous)
+            self.commits += 1
+            self._uncommitted = False
+        except KafkaException as e:
+            # _NO_OFFSET: nothing new to commit, e.g. the partitions were revoked since the last batch
+            if e.args[0].code() != KafkaError._NO_OFFSET:
+                self.commit_errors += 1
+                self.last_error = f"Offset commit failed: {e}"
+            self._uncommitted = False
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        """Stops consuming, commits what was handed to subscribers, closes the consumer and the subscriptions"""
+        self._stopped.set()
+        self._resubscribe.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._commit(asynchronous=False, force=True)
+        self._consumer.close()
+        with self._lock:
+            subscriptions = [subscription for keys in self._routes.values() for subscribers in keys.values() for subscription in subscribers]
+            self._routes.clear()
+        for subscription in subscriptions:
+            subscription.close()
+
+    def stats(self):
+        with self._lock:
+            subscriptions = [subscription.stats() for keys in self._routes.values() for subscribers in keys.values() for subscription in subscribers]
+        return {"consumed": self.consumed, "skipped": self.skipped, "decode_errors": self.decode_errors, "batches": self.batches,
+                "commits": self.commits, "commit_errors": self.commit_errors, "last_error": self.last_error,
+                "subscriptions": subscriptions}
@@ -0,0 +1,61 @@
+import hashlib
+
+# Where an Agent's messages go is stored in did_keys.kafka_topic as a topic address:
+#   dedicated mode: "<topic>"        one single-partition topic per Agent
+#   shared mode:    "<topic>#<did>"  a few partitioned topics shared by all Agents, messages keyed by the Agent's DID
+# Kafka topic names cannot contain '#', so the two forms cannot be confused.
+TOPIC_KEY_SEPARATOR = "#"
+
+AGENT_TOPIC_MODES = ("dedicated", "shared")
+
+# Function to build a topic address
+def topic_address(topic, key=None):
+    return f"{topic}{TOPIC_KEY_SEPARATOR}{key}" if key is not None else topic
+
+# Function to split a topic address into (topic, key); key is None for a dedicated topic
+def parse_topic_address(address):
+    topic, separator, key = address.partition(TOPIC_KEY_SEPARATOR)
+    return topic, (key if separator else None)
+
+
+class SharedAgentTopics:
+    """A fixed set of partitioned topics shared by every Agent, instead of one topic per Agent.
+
+    An Agent is placed on `<prefix><n>` with n from a hash of its DID, and its messages are keyed
+    by the DID: Kafka keeps each Agent's messages in order on one partition, and the broker only
+    tracks count * partitions partitions however many Agents register. The topics are created
+    once, with `partitions` partitions, the first time a registration needs them.
+    """
+
+    def __init__(self, prefix="hsml_agents_", count=8, partitions=32, replication_factor=1):
+        self.prefix = prefix
+        self.count = count
+        self.partitions = partitions
+        self.replication_factor = replication_factor
+        self._names = set(self.names())
+        self.ready = set()  # Topics known to exist on the broker
+
+    def names(self):
+        return [f"{self.prefix}{index:03d}" for index in range(self.count)]
+
+    def topic_for(self, did):
+        index = int.from_bytes(hashlib.sha256(did.encode("utf-8")).digest()[:8], "big") % self.count
+        return f"{self.prefix}{index:03d}"
+
+    def address_for(self, did):
+        """The did_keys.kafka_topic value of an Agent in shared mode"""
+        return topic_address(self.topic_for(did), did)
+
+    def is_shared(self, topic):
+        return topic in self._names
+
+    def ensure(self, topic_names, create_topics):
+        """Creates whichever of the given shared topics are not known to exist yet; returns the ones that exist.
+
+        create_topics(names, num_partitions, replication_factor) returns the names that exist afterwards.
+        """
+        missing = [topic for topic in topic_names if topic not in self.ready]
+        if missing:
+            self.ready.update(create_topics(missing, num_partitions=self.partitions, replication_factor=self.replication_factor))
+        return {topic for topic in topic_names if topic in self.ready}
+
@@ -0,0 +1,106 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from hsml_validators import HSML_CONTEXT
+from message_codec import AGENT_REGISTERED, CODECS, codec_for_content_type, decode_message, encode_message, get_codec
+from stage_timer import LatencyHistogram
+
+AGENT_DID = "did:key:z6MkhaXgBZDvotDkL5257faiztiGiC2QtKLGpbnnEGta2doK"
+
+
+# ---- Sample messages ----
+
+def make_messages(payload_size):
+    """Registry and twin messages of the shapes agents exchange, keyed by scenario name"""
+    document = {
+        "@context": HSML_CONTEXT,
+        "@type": "Agent",
+        "name": "Bench Rover",
+        "swid": AGENT_DID,
+        "creator": {"swid": "did:key:z6MkpTHR8VNsBxYAAWHut2Geadd9jSwuBV8xRoAnwWsdvktH"},
+        "dateCreated": "2025-01-01",
+        "dateModified": "2025-01-01",
+        "description": "Benchmark agent",
+    }
+    padding = payload_size - len(json.dumps(document))
+    if padding > 0:
+        document["additionalProperty"] = "x" * padding
+    return {
+        "agent_registered": ({"message": "New Agent registered: Bench Rover"}, AGENT_REGISTERED),
+        # High-frequency pose update: mostly floats, where binary encodings gain most
+        "twin_update": ({
+            "swid": AGENT_DID,
+            "timestamp": 1767225600.123456,
+            "sequence": 184467,
+            "position": {"x": 1534.2871, "y": -87.90213, "z": 12.004},
+            "rotation": {"x": 0.0012, "y": 0.7071, "z": -0.0009, "w": 0.7071},
+            "velocity": [0.52, -0.013, 0.0],
+            "battery": 0.873,
+            "status": "moving",
+        }, None),
+        "hsml_document": (document, None),
+    }
+
+
+def time_calls(function, argument, iterations):
+    latencies = LatencyHistogram()
+    for _ in range(iterations):
+        started = time.perf_counter_ns()
+        function(argument)
+        latencies.record(time.perf_counter_ns() - started)
+    return latencies.summary()
+
+
+def run_codec(codec_name, scenario, message, schema, iterations):
+    codec = get_codec(codec_name)
+    value, headers = encode_message(message, schema, codec=codec)
+    decoded, _, _ = decode_message(value, headers)
+    if decoded != message:
+        raise AssertionError(f"{codec_name} did not round-trip the {scenario} message")
+    return {
+        "codec": codec_name,
+        "scenario": scenario,
+        "iterations": iterations,
+        "value_bytes": len(value),
+        "header_bytes": sum(len(name) + len(header_value) for name, header_value in headers),
+        # Consumers decode every JSON message with orjson when it is installed, whichever encoder produced it
+        "decoder": codec_for_content_type(codec.content_type).name,
+        "encode": time_calls(lambda m: encode_message(m, schema, codec=codec), message, iterations),
+        "decode": time_calls(lambda v: decode_message(v, headers), value, iterations),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode/decode cost and size of registry Kafka messages per codec")
+    parser.add_argument("--codecs", default=",".join(CODECS), help="Comma-separated codecs to compare")
+    parser.add_argument("--iterations", type=int, default=20000, help="Encodes and decodes timed per codec and scenario")
+    parser.add_argument("--payload-size", type=int, default=1024, help="Approximate JSON size of the HSML document scenario")
+    parser.add_argument("--output", help="Write results as NDJSON to this file instead of stdout")
+    args = parser.parse_args()
+
+    environment = {"python": platform.python_version(), "platform": platform.platform()}
+    output = open(args.output, "w") if args.output else None
+    try:
+        for codec_name in [name.strip() for name in args.codecs.split(",") if name.strip()]:
+            try:
+                get_codec(codec_name)
+            except ImportError as e:
+                print(f"Skipping {codec_name}: {e}", file=sys.stderr)
+                continue
+            for scenario, (message, schema) in make_messages(args.payload_size).items():
+                result = run_codec(codec_name, scenario, message, schema, args.iterations)
+                result["environment"] = environment
+                line = json.dumps(result)
+                if output:
+                    output.write(line + "\n")
+                else:
+                    print(line, flush=True)
+    finally:
+        if output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
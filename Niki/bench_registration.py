@@ -0,0 +1,357 @@
+import argparse
+import contextlib
+import inspect
+import io
+import json
+import os
+import platform
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from confluent_kafka import KafkaError, KafkaException
+from db_pool import ConnectionPool
+from hsml_validators import HSML_CONTEXT
+from kafka_producer import AsyncProducer
+from registration_api import load_registration_api
+from registry_storage import SQLiteConnection, SQLiteStorage
+from stage_timer import LatencyHistogram
+from topic_pool import TopicPool
+
+# ---- In-memory stand-ins for Kafka ----
+
+class FakeTopicMetadata:
+    def __init__(self, topics):
+        self.topics = {topic: None for topic in topics}
+
+
+class FakeAdminClient:
+    """In-memory AdminClient: topics are created instantly"""
+
+    def __init__(self):
+        self.topics = set()
+        self._lock = threading.Lock()
+
+    def create_topics(self, new_topics, **kwargs):
+        futures = {}
+        with self._lock:
+            for new_topic in new_topics:
+                future = Future()
+                if new_topic.topic in self.topics:
+                    future.set_exception(KafkaException(KafkaError(KafkaError.TOPIC_ALREADY_EXISTS, f"Topic '{new_topic.topic}' already exists.")))
+                else:
+                    self.topics.add(new_topic.topic)
+                    future.set_result(None)
+                futures[new_topic.topic] = future
+        return futures
+
+    def list_topics(self, timeout=None):
+        with self._lock:
+            return FakeTopicMetadata(self.topics)
+
+
+class FakeMessage:
+    def __init__(self, topic, value, key, offset, headers=None):
+        self._topic, self._value, self._key, self._offset, self._headers = topic, value, key, offset, headers
+
+    def topic(self):
+        return self._topic
+
+    def value(self):
+        return self._value
+
+    def key(self):
+        return self._key
+
+    def headers(self):
+        return self._headers
+
+    def partition(self):
+        return 0
+
+    def offset(self):
+        return self._offset
+
+
+class FakeProducer:
+    """In-memory Producer: messages are 'delivered' on the next poll() or flush()"""
+
+    def __init__(self):
+        self.messages = []
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def produce(self, topic, value=None, key=None, headers=None, on_delivery=None, **kwargs):
+        with self._lock:
+            message = FakeMessage(topic, value, key, len(self.messages), headers)
+            self.messages.append(message)
+            self._pending.append((on_delivery, message))
+
+    def poll(self, timeout=0):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for on_delivery, message in pending:
+            if on_delivery is not None:
+                on_delivery(None, message)
+        if not pending and timeout:
+            time.sleep(min(timeout, 0.01))
+        return len(pending)
+
+    def flush(self, timeout=None):
+        self.poll(0)
+        return 0
+
+
+def install_stand_ins(api, workdir, pool_size):
+    """Points the loaded API at a fresh SQLite registry and in-memory Kafka; returns the SQLite path.
+
+    Older versions of the script (--api) are covered too: those without the storage layer get the
+    SQLite registry through their db_pool or connect_db(), those producing with a plain confluent
+    Producer get the in-memory one directly, and whatever they would ask on stdin is answered.
+    """
+    db_path = os.path.join(workdir, "did_registry.db")
+    storage = SQLiteStorage(db_path, pool_size=pool_size)  # Creates every registry table
+    if getattr(api, "storage", None) is not None:
+        api.storage.close()
+        api.storage = storage
+    else:
+        storage.close()
+        if isinstance(getattr(api, "db_pool", None), ConnectionPool):
+            api.db_pool.close_all()
+            api.db_pool = ConnectionPool(lambda: SQLiteConnection(db_path), size=pool_size)
+        if hasattr(api, "connect_db"):
+            api.connect_db = lambda: SQLiteConnection(db_path)
+    api.admin_client = FakeAdminClient()
+    if getattr(api, "topic_pool", None) is not None:
+        api.topic_pool.stop()
+        api.topic_pool = TopicPool(api.admin_client, size=api.TOPIC_POOL_SIZE, find_assigned=api.find_assigned_topics,
+                                   claim=getattr(api, "claim_pooled_topics", None), forget=getattr(api, "forget_pooled_topics", None)).start()
+    # The producer the API created on import would keep retrying the configured brokers: shut it down first
+    producer = getattr(api, "producer", None)
+    if isinstance(producer, AsyncProducer):
+        producer.close(timeout=0)
+        api.producer = AsyncProducer(producer=FakeProducer())
+    else:
+        if hasattr(producer, "close"):
+            producer.close()
+        api.producer = FakeProducer()
+    if getattr(api, "shared_agent_topics", None) is not None:
+        api.shared_agent_topics.ready.clear()  # They only exist on the previous scenario's admin client
+    if getattr(api, "outbox_relay", None) is not None:
+        api.outbox_relay.stop()
+        api.outbox_relay.storage = api.storage
+        api.outbox_relay.reset_stats()  # Reported per scenario, not summed over the run
+    if getattr(api, "registry_filter", None) is not None:
+        api.registry_filter.reset()  # Holds the previous scenario's DIDs otherwise
+        api.registry_filter.ensure_loaded(api.db_cursor)  # As registration_service.py does at startup
+    return db_path
+
+
+def remove_stand_ins(api):
+    """Stops the threads a scenario started and closes its registry before the scenario's directory is removed"""
+    if getattr(api, "outbox_relay", None) is not None:
+        api.outbox_relay.stop()
+    if getattr(api, "topic_pool", None) is not None:
+        api.topic_pool.stop()
+    if isinstance(api.producer, AsyncProducer):
+        api.producer.close()
+    if getattr(api, "storage", None) is not None:
+        api.storage.close()
+    elif isinstance(getattr(api, "db_pool", None), ConnectionPool):
+        api.db_pool.close_all()
+
+
+def answer_prompts(api, registrar_key, domain_key):
+    """Older scripts ask on stdin for what the current one takes as arguments: answer as those arguments would"""
+    def answer(prompt=""):
+        if "Type 'new'" in prompt:
+            return "login"
+        if "this Credential is giving access to" in prompt:
+            return domain_key
+        if "private_key.pem path" in prompt:
+            return registrar_key
+        if "overwrite" in prompt:
+            return "no"
+        raise RuntimeError(f"Unexpected prompt: {prompt}")
+    api.input = answer  # Module globals are looked up before builtins
+
+
+def call_supported(function, *args, **kwargs):
+    """Calls function with only the keyword arguments its version of the API accepts"""
+    parameters = inspect.signature(function).parameters
+    return function(*args, **{name: value for name, value in kwargs.items() if name in parameters})
+
+
+# ---- HSML payloads ----
+
+def make_document(entity_type, index, payload_size, registrar_did=None, domain_did=None, grantee_did=None):
+    name = f"Bench {entity_type} {index}"
+    data = {"@context": HSML_CONTEXT, "@type": entity_type, "name": name, "description": "Benchmark entity"}
+    if entity_type == "Person":
+        data.update({"birthDate": "1990-01-01", "email": f"person{index}@example.org", "affiliation": "JPL"})
+    elif entity_type == "Organization":
+        data.update({"url": "https://example.org", "address": "Pasadena, CA", "foundingDate": "1936-10-31",
+                     "email": f"org{index}@example.org"})
+    elif entity_type == "Agent":
+        data.update({"creator": {"swid": registrar_did}, "dateCreated": "2025-01-01", "dateModified": "2025-01-01"})
+    elif entity_type == "Credential":
+        data.update({
+            "issuedBy": {"swid": registrar_did},
+            "authorizedForDomain": {"swid": domain_did, "name": "Bench Domain"},
+            "accessAuthorization": {"swid": grantee_did, "@type": "Person"},
+            "validFrom": "2025-01-01",
+            "validUntil": "2030-01-01",
+        })
+    elif entity_type == "Entity":
+        data["linkedTo"] = {"swid": registrar_did}
+    # Pad to roughly payload_size bytes of JSON
+    padding = payload_size - len(json.dumps(data))
+    if padding > 0:
+        data["additionalProperty"] = "x" * padding
+    return data
+
+
+def write_document(directory, data, index):
+    path = os.path.join(directory, f"doc_{index}.json")
+    with open(path, "w") as document_file:
+        json.dump(data, document_file)
+    return path
+
+
+# ---- Scenarios ----
+
+def run_scenario(api, entity_type, payload_size, concurrency, iterations, workdir):
+    install_stand_ins(api, workdir, pool_size=max(2, concurrency))
+    try:
+        return measure_scenario(api, entity_type, payload_size, concurrency, iterations, workdir)
+    finally:
+        remove_stand_ins(api)
+
+
+def measure_scenario(api, entity_type, payload_size, concurrency, iterations, workdir):
+    timer = getattr(api, "registration_timer", None)
+    if timer is not None:
+        timer.reset()
+    documents_dir = os.path.join(workdir, "documents")
+    os.makedirs(documents_dir, exist_ok=True)
+
+    # Setup outside the measured window: a registrar Person and a Domain it controls
+    with contextlib.redirect_stdout(io.StringIO()):
+        registrar_dir = os.path.join(workdir, "registrar")
+        os.makedirs(registrar_dir)
+        registrar = api.register_entity(write_document(documents_dir, make_document("Person", "registrar", 0), "registrar"), registrar_dir)
+        domain_dir = os.path.join(workdir, "domain")
+        os.makedirs(domain_dir)
+        domain = api.register_entity(write_document(documents_dir, make_document("Entity", "domain", 0, registrar["did_key"]), "domain"),
+                                     domain_dir, registered_by=registrar["did_key"])
+    registrar_did = registrar["did_key"]
+    registrar_key = registrar["private_key_path"]
+    answer_prompts(api, registrar_key, domain["private_key_path"])
+
+    jobs = []
+    for i in range(iterations):
+        if entity_type == "login":
+            jobs.append(None)
+            continue
+        if entity_type == "duplicate":
+            # The same Entity resubmitted every time, as a CI pipeline re-pushing its catalog does
+            data = make_document("Entity", 0, payload_size, registrar_did)
+        else:
+            # Every Credential grants a different DID, so the Domain's canAccess list keeps growing
+            data = make_document(entity_type, i, payload_size, registrar_did, domain["did_key"], f"did:key:zBenchGrantee{i}")
+        jobs.append(write_document(documents_dir, data, i))
+
+    def run_job(i):
+        started = time.perf_counter_ns()
+        if entity_type == "login":
+            ok = call_supported(api.login_or_register, choice="login", private_key_path=registrar_key) == registrar_did
+        else:
+            output_dir = os.path.join(workdir, "out", str(i))
+            os.makedirs(output_dir, exist_ok=True)
+            registered_by = None if entity_type in ("Person", "Organization") else registrar_did
+            result = call_supported(api.register_entity, jobs[i], output_dir, registered_by=registered_by, overwrite=False,
+                                    domain_private_key_path=domain["private_key_path"])
+            ok = bool(result) and result.get("status") == "success"
+        return ok, time.perf_counter_ns() - started
+
+    latencies = LatencyHistogram()
+    errors = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for ok, duration_ns in executor.map(run_job, range(iterations)):
+                latencies.record(duration_ns)
+                errors += 0 if ok else 1
+        wall_seconds = time.perf_counter() - wall_start
+        if getattr(api, "outbox_relay", None) is not None:
+            api.outbox_relay.drain()
+        api.producer.flush()
+        if getattr(api, "output_writer", None) is not None:
+            api.output_writer.flush()  # Before the scenario's directory is removed
+
+    # Scripts from before connection pooling connect per call and have no pool to report
+    pool = api.storage.pool if getattr(api, "storage", None) is not None else getattr(api, "db_pool", None)
+    return {
+        "entity_type": entity_type,
+        "payload_bytes": payload_size,
+        "concurrency": concurrency,
+        "iterations": iterations,
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 4),
+        "throughput_per_second": round(iterations / wall_seconds, 2) if wall_seconds else None,
+        "latency": latencies.summary(),
+        "stages": timer.summary() if timer is not None else None,
+        "db_pool": pool.metrics() if isinstance(pool, ConnectionPool) else None,
+        "output_writer": api.output_writer.stats() if getattr(api, "output_writer", None) is not None else None,
+        "existence_filter": api.registry_filter.stats() if getattr(api, "registry_filter", None) is not None else None,
+        "outbox": api.outbox_relay.stats() if getattr(api, "outbox_relay", None) is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registration API latency benchmark against an embedded SQLite registry and in-memory Kafka stand-ins")
+    parser.add_argument("--api", help="Path of the Registration API script to benchmark (defaults to the current version)")
+    parser.add_argument("--types", default="Person,Organization,Entity,Agent,Credential,login,duplicate",
+                        help="Comma-separated entity types to register ('login' benchmarks login_or_register, "
+                             "'duplicate' resubmits one identical Entity)")
+    parser.add_argument("--payload-sizes", default="512,8192", help="Comma-separated approximate HSML document sizes in bytes")
+    parser.add_argument("--concurrency", default="1,8", help="Comma-separated numbers of concurrent registrations")
+    parser.add_argument("--iterations", type=int, default=200, help="Registrations per scenario")
+    parser.add_argument("--agent-topic-mode", choices=["dedicated", "shared"], help="Agent topic mode to benchmark (defaults to the API's)")
+    parser.add_argument("--output", help="Write results as NDJSON to this file instead of stdout")
+    args = parser.parse_args()
+
+    api = load_registration_api(args.api)
+    if args.agent_topic_mode:
+        api.AGENT_TOPIC_MODE = args.agent_topic_mode
+    entity_types = [entity_type.strip() for entity_type in args.types.split(",") if entity_type.strip()]
+    payload_sizes = [int(size) for size in args.payload_sizes.split(",")]
+    concurrency_levels = [int(level) for level in args.concurrency.split(",")]
+    environment = {"api": os.path.basename(api.__file__), "python": platform.python_version(), "platform": platform.platform(),
+                   "agent_topic_mode": getattr(api, "AGENT_TOPIC_MODE", "dedicated")}
+
+    output = open(args.output, "w") if args.output else None
+    try:
+        for entity_type in entity_types:
+            # Payload size does not apply to logins
+            for payload_size in (payload_sizes[:1] if entity_type == "login" else payload_sizes):
+                for concurrency in concurrency_levels:
+                    workdir = tempfile.mkdtemp(prefix="bench_registration_")
+                    try:
+                        result = run_scenario(api, entity_type, payload_size, concurrency, args.iterations, workdir)
+                    finally:
+                        shutil.rmtree(workdir, ignore_errors=True)
+                    result["environment"] = environment
+                    line = json.dumps(result)
+                    if output:
+                        output.write(line + "\n")
+                    else:
+                        print(line, flush=True)
+    finally:
+        if output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
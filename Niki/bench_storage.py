@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hsml_validators import HSML_CONTEXT
+from registry_storage import MySQLStorage, SQLiteStorage
+from stage_timer import LatencyHistogram
+
+# Every DID the benchmark writes starts with this, so its rows can be removed from a shared MySQL registry
+BENCH_DID_PREFIX = "did:key:zBenchStorage"
+
+OPERATIONS = ("insert", "exists_hit", "exists_miss", "get_metadata", "get_topic", "grant_access")
+
+
+def bench_did(kind, index):
+    return f"{BENCH_DID_PREFIX}{kind}{index}"
+
+
+def make_row(index, payload_size):
+    did = bench_did("Agent", index)
+    metadata = {"@context": HSML_CONTEXT, "@type": "Agent", "name": f"Bench Agent {index}", "swid": did}
+    padding = payload_size - len(json.dumps(metadata))
+    if padding > 0:
+        metadata["description"] = "x" * padding
+    return (did, did.replace("did:key:", ""), json.dumps(metadata), bench_did("Person", 0), f"bench_storage_{index}", None, None)
+
+
+def run_operation(storage, operation, count, concurrency, payload_size):
+    """Runs `count` single-operation transactions on `concurrency` threads; returns the result line"""
+    if operation == "insert":
+        job = lambda i: storage.insert(*make_row(i, payload_size))
+    elif operation == "exists_hit":
+        job = lambda i: storage.exists(bench_did("Agent", i))
+    elif operation == "exists_miss":
+        job = lambda i: storage.exists(bench_did("Missing", i))
+    elif operation == "get_metadata":
+        job = lambda i: storage.get_metadata(bench_did("Agent", i))
+    elif operation == "get_topic":
+        job = lambda i: storage.get_topic(bench_did("Agent", i))
+    elif operation == "grant_access":
+        job = lambda i: storage.grant_access(bench_did("Domain", 0), bench_did("Grantee", i), {"swid": bench_did("Grantee", i)})
+    else:
+        raise ValueError(f"Unknown operation: {operation}")
+
+    def timed_job(i):
+        started = time.perf_counter_ns()
+        job(i)
+        return time.perf_counter_ns() - started
+
+    latencies = LatencyHistogram()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for duration_ns in executor.map(timed_job, range(count)):
+            latencies.record(duration_ns)
+    wall_seconds = time.perf_counter() - wall_start
+    return {
+        "backend": storage.backend,
+        "operation": operation,
+        "concurrency": concurrency,
+        "operations": count,
+        "wall_seconds": round(wall_seconds, 4),
+        "throughput_per_second": round(count / wall_seconds, 2) if wall_seconds else None,
+        "latency": latencies.summary(),
+    }
+
+
+def remove_bench_rows(storage):
+    with storage.transaction() as cursor:
+        cursor.execute("DELETE FROM did_keys WHERE did LIKE %s", (BENCH_DID_PREFIX + "%",))
+        cursor.execute("DELETE FROM domain_access WHERE domain_did LIKE %s", (BENCH_DID_PREFIX + "%",))
+        cursor.execute("DELETE FROM access_closure WHERE domain_did LIKE %s", (BENCH_DID_PREFIX + "%",))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare registry storage backends operation by operation")
+    parser.add_argument("--backends", default="sqlite", help="Comma-separated backends to benchmark: sqlite, mysql")
+    parser.add_argument("--sqlite-path", help="Registry file for the sqlite backend (defaults to a temporary file)")
+    parser.add_argument("--mysql-config", help="JSON file with mysql.connector.connect() arguments; use a test database, "
+                                               "benchmark rows are deleted afterwards")
+    parser.add_argument("--operations", default=",".join(OPERATIONS), help="Comma-separated operations to time")
+    parser.add_argument("--count", type=int, default=2000, help="Operations per scenario")
+    parser.add_argument("--concurrency", default="1,8", help="Comma-separated numbers of concurrent threads")
+    parser.add_argument("--payload-size", type=int, default=1024, help="Approximate metadata size in bytes")
+    parser.add_argument("--output", help="Write results as NDJSON to this file instead of stdout")
+    args = parser.parse_args()
+
+    operations = [operation.strip() for operation in args.operations.split(",") if operation.strip()]
+    concurrency_levels = [int(level) for level in args.concurrency.split(",")]
+    environment = {"python": platform.python_version(), "platform": platform.platform()}
+
+    output = open(args.output, "w") if args.output else None
+    try:
+        for backend in [backend.strip() for backend in args.backends.split(",") if backend.strip()]:
+            for concurrency in concurrency_levels:
+                workdir = None
+                if backend == "sqlite":
+                    sqlite_path = args.sqlite_path
+                    if sqlite_path is None:
+                        workdir = tempfile.mkdtemp(prefix="bench_storage_")
+                        sqlite_path = os.path.join(workdir, "did_registry.db")
+                    storage = SQLiteStorage(sqlite_path, pool_size=concurrency)
+                elif backend == "mysql":
+                    if not args.mysql_config:
+                        parser.error("--mysql-config is required for the mysql backend")
+                    with open(args.mysql_config) as config_file:
+                        storage = MySQLStorage(json.load(config_file), pool_size=concurrency)
+                    storage.migrate()
+                else:
+                    parser.error(f"Unknown backend: {backend}")
+                try:
+                    remove_bench_rows(storage)
+                    # Operations run in order: insert fills the rows the lookups read
+                    for operation in operations:
+                        result = run_operation(storage, operation, args.count, concurrency, args.payload_size)
+                        result["payload_bytes"] = args.payload_size
+                        result["environment"] = environment
+                        line = json.dumps(result)
+                        if output:
+                            output.write(line + "\n")
+                        else:
+                            print(line, flush=True)
+                    remove_bench_rows(storage)
+                finally:
+                    storage.close()
+                    if workdir:
+                        shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        if output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
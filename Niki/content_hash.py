@@ -0,0 +1,48 @@
+import hashlib
+import json
+
+# Fields the registry fills in itself, left out so a resubmitted document hashes like the stored one
+HASH_EXCLUDED_FIELDS = ("swid",)
+
+# What to do with a document identical to one the same user already registered:
+#   update - answer with the existing DID and save its JSON again; no new key, row or topic
+#   reject - answer with an error naming the existing DID
+#   off    - register it again as a new entity
+DUPLICATE_POLICIES = ("update", "reject", "off")
+
+# Hashes looked up per IN (...) query
+HASH_LOOKUP_CHUNK_SIZE = 1000
+
+# Function to hash an HSML document independently of key order and whitespace
+def canonical_hash(data):
+    """Hex SHA-256 of the document as sorted, compact JSON, without the registry-assigned fields"""
+    content = {key: value for key, value in data.items() if key not in HASH_EXCLUDED_FIELDS}
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+# Function to derive the key that makes a (registrant, content) pair unique in did_keys
+def duplicate_key(content_hash, registered_by=None):
+    """Hex SHA-256 of the registrant and the content hash; registered_by None (self-registration) is its own scope.
+
+    Stored in did_keys.duplicate_key, under a unique index, for registrations made with the "update" or
+    "reject" policy, so of two identical documents submitted at the same time only one is registered.
+    """
+    return hashlib.sha256(f"{registered_by or ''}\n{content_hash}".encode("utf-8")).hexdigest()
+
+# Function to find documents already registered with the same content by the same user
+def find_duplicates(cursor, content_hashes, registered_by=None, chunk_size=HASH_LOOKUP_CHUNK_SIZE):
+    """Returns {content_hash: did}. With registered_by None (a new Person or Organization registering
+    itself) only self-registered entities match."""
+    content_hashes = list(content_hashes)
+    duplicates = {}
+    for start in range(0, len(content_hashes), chunk_size):
+        chunk = content_hashes[start:start + chunk_size]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        if registered_by is None:
+            cursor.execute(f"SELECT content_hash, did FROM did_keys WHERE content_hash IN ({placeholders}) AND registered_by = did", chunk)
+        else:
+            cursor.execute(f"SELECT content_hash, did FROM did_keys WHERE content_hash IN ({placeholders}) AND registered_by = %s",
+                           chunk + [registered_by])
+        for content_hash, did in cursor.fetchall():
+            duplicates.setdefault(content_hash, did)
+    return duplicates
@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became free within the pool timeout"""
+
+
+class ConnectionPool:
+    """Fixed-size pool of database connections created lazily by a connect() factory.
+
+    Callers that find every connection in use wait for one to be released; how
+    often and how long they wait is recorded so pool sizing can be tuned from
+    metrics() instead of guessed.
+    """
+
+    def __init__(self, connect, size=8, timeout=30.0):
+        if size < 1:
+            raise ValueError("Connection pool size must be at least 1")
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()  # LIFO keeps the most recently used (warm) connections in rotation
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        # Pool-wait metrics
+        self._acquisitions = 0
+        self._waits = 0
+        self._wait_ns_total = 0
+        self._wait_ns_max = 0
+        self._timeouts = 0
+
+    def _new_connection(self):
+        try:
+            return self.connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def acquire(self):
+        """Returns a live connection, waiting up to `timeout` seconds when the pool is exhausted"""
+        waited_ns = 0
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                conn = self._new_connection()
+            else:
+                start_wait = time.perf_counter_ns()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeout(f"No database connection became free within {self.timeout} seconds")
+                waited_ns = time.perf_counter_ns() - start_wait
+
+        # Replace connections the server has dropped while they sat idle
+        if hasattr(conn, "is_connected") and not conn.is_connected():
+            self._discard(conn)
+            with self._lock:
+                self._created += 1
+            conn = self._new_connection()
+
+        with self._lock:
+            self._acquisitions += 1
+            self._in_use += 1
+            if waited_ns:
+                self._waits += 1
+                self._wait_ns_total += waited_ns
+                self._wait_ns_max = max(self._wait_ns_max, waited_ns)
+        return conn
+
+    def release(self, conn, broken=False):
+        with self._lock:
+            self._in_use -= 1
+        if broken:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    @contextmanager
+    def cursor(self):
+        """Yields a cursor on a pooled connection; commits on success and rolls back on error"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            finally:
+                cursor.close()
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "acquisitions": self._acquisitions,
+                "waits": self._waits,
+                "wait_ms_total": self._wait_ns_total / 1e6,
+                "wait_ms_max": self._wait_ns_max / 1e6,
+                "wait_ms_avg": (self._wait_ns_total / self._waits / 1e6) if self._waits else 0.0,
+                "timeouts": self._timeouts,
+            }
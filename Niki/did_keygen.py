@@ -0,0 +1,215 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from keygen_worker import generate_did_key_pairs_chunk
+
+# Multicodec prefixes used by the did:key method (https://w3c-ccg.github.io/did-method-key/)
+ED25519_PUB_CODEC = b"\xed\x01"
+SECP256K1_PUB_CODEC = b"\xe7\x01"
+P256_PUB_CODEC = b"\x80\x24"
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+# Encode bytes as base58btc (Bitcoin alphabet)
+def base58_encode(raw):
+    number = int.from_bytes(raw, "big")
+    encoded = ""
+    while number > 0:
+        number, remainder = divmod(number, 58)
+        encoded = BASE58_ALPHABET[remainder] + encoded
+    # Every leading zero byte is written as a leading '1'
+    leading_zeros = len(raw) - len(raw.lstrip(b"\x00"))
+    return "1" * leading_zeros + encoded
+
+# Build the did:key identifier for a public key object
+def did_from_public_key(public_key):
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        codec = ED25519_PUB_CODEC
+        raw = public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    elif isinstance(public_key, ec.EllipticCurvePublicKey) and isinstance(public_key.curve, ec.SECP256K1):
+        codec = SECP256K1_PUB_CODEC
+        raw = public_key.public_bytes(serialization.Encoding.X962, serialization.PublicFormat.CompressedPoint)
+    elif isinstance(public_key, ec.EllipticCurvePublicKey) and isinstance(public_key.curve, ec.SECP256R1):
+        codec = P256_PUB_CODEC
+        raw = public_key.public_bytes(serialization.Encoding.X962, serialization.PublicFormat.CompressedPoint)
+    else:
+        raise ValueError(f"Unsupported key type for did:key: {type(public_key).__name__}")
+    # 'z' is the multibase prefix for base58btc
+    return "did:key:z" + base58_encode(codec + raw)
+
+# Derive the DID:key from a PEM encoded private key (string or bytes)
+def did_from_private_key_pem(private_key_pem):
+    if isinstance(private_key_pem, str):
+        private_key_pem = private_key_pem.encode("utf-8")
+    private_key = serialization.load_pem_private_key(private_key_pem, password=None)
+    return did_from_public_key(private_key.public_key())
+
+# Same contract as CLItool.extract_did_from_private_key, without starting a new interpreter
+def extract_did_from_private_key(private_key_path):
+    with open(private_key_path, "rb") as key_file:
+        return did_from_private_key_pem(key_file.read())
+
+# Function to generate a new DID:key in-process
+def generate_did_key_pair():
+    """Generates an Ed25519 key and returns (did_key, private_key_pem) with the PEM as a string"""
+    private_key = ed25519.Ed25519PrivateKey.generate()
+    private_key_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    ).decode("utf-8")
+    return did_from_public_key(private_key.public_key()), private_key_pem
+
+# Keys generated per task handed to a worker process; fewer keys than this are generated in-process
+KEYGEN_CHUNK_SIZE = 500
+
+_main_script_lock = threading.Lock()
+
+# Spawned workers run the caller's main script again (as __mp_main__) before their first task; for the
+# Registration API that means opening the registry, a Kafka producer and every pool. Workers only need
+# keygen_worker, so hide the main script from multiprocessing while they start.
+@contextmanager
+def _without_main_script():
+    main_module = sys.modules["__main__"]
+    with _main_script_lock:
+        saved = {name: main_module.__dict__[name] for name in ("__file__", "__spec__") if name in main_module.__dict__}
+        main_module.__dict__.pop("__file__", None)
+        main_module.__spec__ = None
+        try:
+            yield
+        finally:
+            main_module.__dict__.update(saved)
+
+# Function to generate many DID:keys at once across worker processes
+def generate_did_key_pairs(count, workers=None, chunk_size=KEYGEN_CHUNK_SIZE, executor=None):
+    """Returns `count` distinct (did_key, private_key_pem) pairs, generated on up to `workers` processes
+    (defaults to the number of cores). Pass an executor to reuse worker processes across calls.
+
+    Workers are spawned, not forked, so they never inherit a lock held by one of the caller's threads,
+    and only import keygen_worker, not the caller's main script. The workers of an executor passed in
+    are started by that executor and import the main script as usual.
+    """
+    workers = workers or os.cpu_count() or 1
+    if executor is None and (workers == 1 or count <= chunk_size):
+        return generate_did_key_pairs_chunk(count)
+    chunks = [chunk_size] * (count // chunk_size) + ([count % chunk_size] if count % chunk_size else [])
+    key_pairs = {}
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=multiprocessing.get_context("spawn")) as pool:
+            with _without_main_script():
+                # Submitting the tasks starts the workers
+                results = pool.map(generate_did_key_pairs_chunk, chunks)
+            for chunk in results:
+                key_pairs.update(chunk)
+    else:
+        for chunk in executor.map(generate_did_key_pairs_chunk, chunks):
+            key_pairs.update(chunk)
+    # A repeated DID is as good as impossible; top up in-process just in case
+    while len(key_pairs) < count:
+        key_pairs.update(generate_did_key_pairs_chunk(count - len(key_pairs)))
+    return list(key_pairs.items())
+
+
+class KeyPool:
+    """Pool of pre-generated (did_key, private_key_pem) pairs kept topped up by a background thread.
+
+    get() never blocks on an empty pool: it falls back to generating a key inline,
+    so the pool only ever removes key generation from the registration latency.
+    """
+
+    def __init__(self, size=32, low_water=None):
+        self.size = size
+        # Refill once the pool drops to this many keys (defaults to half the pool)
+        self.low_water = size // 2 if low_water is None else low_water
+        self._keys = queue.Queue(maxsize=size)
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.served_from_pool = 0
+        self.generated_inline = 0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._refill_loop, name="did-key-pool", daemon=True)
+            self._thread.start()
+            self._wakeup.set()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get(self):
+        """Returns a (did_key, private_key_pem) pair that has never been handed out before"""
+        if self._thread is None:
+            self.start()
+        try:
+            key_pair = self._keys.get_nowait()
+            self.served_from_pool += 1
+        except queue.Empty:
+            key_pair = generate_did_key_pair()
+            self.generated_inline += 1
+        if self._keys.qsize() <= self.low_water:
+            self._wakeup.set()
+        return key_pair
+
+    def qsize(self):
+        return self._keys.qsize()
+
+    def _refill_loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while not self._stopped.is_set() and not self._keys.full():
+                try:
+                    self._keys.put_nowait(generate_did_key_pair())
+                except queue.Full:
+                    break
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate Ed25519 DID:keys in bulk, in parallel across cores")
+    parser.add_argument("count", type=int, help="Number of DID:keys to generate")
+    parser.add_argument("--workers", type=int, help="Worker processes (defaults to the number of cores)")
+    parser.add_argument("--output", default="-", help="NDJSON file of {\"did\", \"private_key_pem\"} lines, '-' for stdout")
+    parser.add_argument("--pem-dir", help="Also save each private key as <did suffix>.pem in this directory")
+    parser.add_argument("--check-registry", action="store_true",
+                        help="Only hand out DIDs not yet in the registry (one batched IN query per chunk)")
+    args = parser.parse_args()
+
+    if args.check_registry:
+        from registration_api import load_registration_api
+        key_pairs = load_registration_api().generate_unique_did_keys(args.count, workers=args.workers)
+    else:
+        key_pairs = generate_did_key_pairs(args.count, workers=args.workers)
+
+    if args.pem_dir:
+        os.makedirs(args.pem_dir, exist_ok=True)
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        for did_key, private_key_pem in key_pairs:
+            output.write(json.dumps({"did": did_key, "private_key_pem": private_key_pem}) + "\n")
+            if args.pem_dir:
+                pem_path = os.path.join(args.pem_dir, f"{did_key.replace('did:key:', '')}.pem")
+                # Private keys are readable by their owner only
+                with os.fdopen(os.open(pem_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as pem_file:
+                    pem_file.write(private_key_pem)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
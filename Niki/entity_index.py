@@ -0,0 +1,106 @@
+import json
+
+# did_keys.metadata is an opaque JSON blob, so the fields dashboards filter on are copied out when a
+# row is written: @type and name into indexed did_keys columns (registered_by already is one), and
+# every reference to another DID into entity_links(did, relation, target_did). A query is then an
+# index range scan, paginated by DID (keyset), instead of decoding every row.
+
+# Fields holding references to other entities, as {"swid": ...} objects, lists of them or bare DIDs
+LINK_FIELDS = ("linkedTo", "authorizedForDomain", "issuedBy", "accessAuthorization")
+
+# Widths of the indexed columns; longer values are stored cut to fit
+ENTITY_TYPE_LENGTH = 64
+NAME_LENGTH = 255
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Character escaping % and _ in a name prefix (same in MySQL and SQLite, unlike a backslash)
+LIKE_ESCAPE = "!"
+
+# Function to collect the DIDs a link field refers to
+def link_targets(value):
+    if isinstance(value, str):
+        return [value] if value else []
+    if isinstance(value, dict):
+        return [value["swid"]] if isinstance(value.get("swid"), str) and value["swid"] else []
+    if isinstance(value, list):
+        return [target for item in value for target in link_targets(item)]
+    return []
+
+# Function to pull the queryable fields out of an HSML document
+def index_fields(data):
+    """Returns (entity_type, name, links) with links a list of distinct (relation, target_did) pairs"""
+    entity_type = data.get("@type") if isinstance(data.get("@type"), str) else None
+    name = data.get("name") if isinstance(data.get("name"), str) else None
+    links = []
+    for relation in LINK_FIELDS:
+        for target in link_targets(data.get(relation)):
+            if (relation, target) not in links:
+                links.append((relation, target))
+    return (entity_type[:ENTITY_TYPE_LENGTH] if entity_type else None), (name[:NAME_LENGTH] if name else None), links
+
+# Function to replace the entity_links rows of the given DIDs
+def replace_links(cursor, links_by_did):
+    """links_by_did is a list of (did, links) as returned by index_fields"""
+    if not links_by_did:
+        return
+    cursor.executemany("DELETE FROM entity_links WHERE did = %s", [(did,) for did, _ in links_by_did])
+    rows = [(did, relation, target) for did, links in links_by_did for relation, target in links]
+    if rows:
+        cursor.executemany("INSERT IGNORE INTO entity_links (did, relation, target_did) VALUES (%s, %s, %s)", rows)
+
+# Function to page through registered entities by type, name, registrar or link
+def query_entities(cursor, entity_type=None, registered_by=None, name=None, name_prefix=None, linked_to=None,
+                   relation="linkedTo", after=None, limit=DEFAULT_PAGE_SIZE, include_metadata=False):
+    """Returns {"entities": [...], "next_after": did or None}, ordered by DID.
+
+    Filters combine with AND. linked_to matches entities whose `relation` field (linkedTo,
+    authorizedForDomain, issuedBy or accessAuthorization) refers to that DID. Pass the previous
+    page's next_after as `after` to get the next page; it is None on the last page.
+    """
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    if linked_to is not None and relation not in LINK_FIELDS:
+        raise ValueError(f"Unknown relation: {relation} (expected one of {', '.join(LINK_FIELDS)})")
+
+    columns = "k.did, k.entity_type, k.name, k.registered_by, k.kafka_topic" + (", k.metadata" if include_metadata else "")
+    conditions = []
+    params = []
+    if linked_to is not None:
+        # Driven by the entity_links (target_did, relation, did) index
+        source = "entity_links l JOIN did_keys k ON k.did = l.did"
+        order = "l.did"
+        conditions += ["l.target_did = %s", "l.relation = %s"]
+        params += [linked_to, relation]
+    else:
+        source = "did_keys k"
+        order = "k.did"
+    if entity_type is not None:
+        conditions.append("k.entity_type = %s")
+        params.append(entity_type)
+    if registered_by is not None:
+        conditions.append("k.registered_by = %s")
+        params.append(registered_by)
+    if name is not None:
+        conditions.append("k.name = %s")
+        params.append(name[:NAME_LENGTH])
+    if name_prefix is not None:
+        escaped = name_prefix.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2).replace("%", LIKE_ESCAPE + "%").replace("_", LIKE_ESCAPE + "_")
+        conditions.append(f"k.name LIKE %s ESCAPE '{LIKE_ESCAPE}'")
+        params.append(escaped + "%")
+    if after is not None:
+        conditions.append(f"{order} > %s")
+        params.append(after)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    # One extra row tells whether there is another page
+    cursor.execute(f"SELECT {columns} FROM {source}{where} ORDER BY {order} LIMIT %s", params + [limit + 1])
+    rows = cursor.fetchall()
+    entities = []
+    for row in rows[:limit]:
+        entity = {"did": row[0], "@type": row[1], "name": row[2], "registered_by": row[3], "kafka_topic": row[4]}
+        if include_metadata:
+            entity["metadata"] = json.loads(row[5])
+        entities.append(entity)
+    return {"entities": entities, "next_after": entities[-1]["did"] if len(rows) > limit else None}
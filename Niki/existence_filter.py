@@ -0,0 +1,123 @@
+import hashlib
+import math
+import threading
+
+# Rows read per fetchmany call while loading the filter
+LOAD_FETCH_SIZE = 10000
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter of strings: no false negatives, about error_rate false positives
+    while it holds at most `capacity` items"""
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        capacity = max(1, int(capacity))
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one 128-bit digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class ExistenceFilter:
+    """Registered DIDs and Kafka topic names, so uniqueness checks skip the database on a definite miss.
+
+    Until load() has run every lookup answers "maybe", which sends callers to the database as before.
+    The filter only knows what was registered when it was loaded plus what this process added since,
+    so the database (primary key on did) stays the authority when a value may already exist, and a
+    value another process may have chosen (a caller-supplied swid) must always be checked there.
+    Loading reads every row of did_keys: worth it for a long-lived process, not for a one-shot run.
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything; lookups answer "maybe" until the next load()"""
+        with self._lock:
+            self.loaded = False
+            self.dids = BloomFilter(self.capacity, self.error_rate)
+            self.topics = BloomFilter(self.capacity, self.error_rate)
+            self.lookups = 0
+            self.misses = 0
+
+    def load(self, cursor):
+        """Fills the filter from did_keys, sized for twice the rows found so it has room to grow"""
+        cursor.execute("SELECT COUNT(*) FROM did_keys")
+        capacity = max(self.capacity, 2 * cursor.fetchone()[0])
+        dids = BloomFilter(capacity, self.error_rate)
+        topics = BloomFilter(capacity, self.error_rate)
+        cursor.execute("SELECT did, kafka_topic FROM did_keys")
+        while True:
+            rows = cursor.fetchmany(LOAD_FETCH_SIZE)
+            if not rows:
+                break
+            for did, kafka_topic in rows:
+                dids.add(did)
+                if kafka_topic:
+                    topics.add(kafka_topic)
+        with self._lock:
+            self.dids, self.topics, self.loaded = dids, topics, True
+
+    def ensure_loaded(self, cursor_factory):
+        """Loads the filter once; cursor_factory is a context manager yielding a cursor (e.g. db_cursor)"""
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+        with cursor_factory() as cursor:
+            self.load(cursor)
+
+    def add(self, did=None, kafka_topic=None):
+        with self._lock:
+            if did:
+                self.dids.add(did)
+            if kafka_topic:
+                self.topics.add(kafka_topic)
+
+    def _maybe(self, bloom, value):
+        with self._lock:
+            self.lookups += 1
+            if not self.loaded or value in bloom:
+                return True
+            self.misses += 1
+            return False
+
+    def may_contain_did(self, did):
+        """False means the DID is certainly not registered"""
+        return self._maybe(self.dids, did)
+
+    def may_contain_topic(self, kafka_topic):
+        """False means no registered Agent uses this topic"""
+        return self._maybe(self.topics, kafka_topic)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "dids": self.dids.count,
+                "topics": self.topics.count,
+                "capacity": self.dids.capacity,
+                "lookups": self.lookups,
+                "database_checks_skipped": self.misses,
+            }
@@ -0,0 +1,79 @@
+HSML_CONTEXT = "https://digital-twin-interoperability.github.io/hsml-schema-context/hsml.jsonld"
+
+# Marker without slashes, so JSON text that escapes '/' as '\/' is still recognised
+HSML_CONTEXT_MARKER = "hsml-schema-context"
+
+
+class HSMLValidator:
+    """Validation rules for one HSML @type, compiled once into tuples of plain lookups"""
+
+    def __init__(self, entity_type, required, nested_required=(), warn_if_missing=()):
+        self.entity_type = entity_type
+        self.required = tuple(required)
+        # (parent field, child field): the parent must be an object that has the child
+        self.nested_required = tuple(nested_required)
+        # (fields, message): warn when any of the fields is missing
+        self.warn_if_missing = tuple((tuple(fields), message) for fields, message in warn_if_missing)
+
+    def validate(self, data):
+        """Returns (errors, warnings) with every violation found in a single pass"""
+        errors = []
+        missing_fields = [field for field in self.required if field not in data]
+        if missing_fields:
+            errors.append(f"Missing required fields: {missing_fields}")
+        for parent, child in self.nested_required:
+            value = data.get(parent)
+            if value is None:
+                continue  # Already reported as a missing required field
+            if not isinstance(value, dict):
+                errors.append(f"'{parent}' must be an object with a '{child}'")
+            elif not value.get(child):
+                errors.append(f"Missing required '{child}' in '{parent}'")
+        warnings = [message for fields, message in self.warn_if_missing if any(field not in data for field in fields)]
+        return errors, warnings
+
+
+# One compiled validator per HSML @type
+VALIDATORS = {
+    validator.entity_type: validator for validator in (
+        HSMLValidator("Entity", ["name", "description"],
+                      warn_if_missing=[(["linkedTo"], "Object not linked to any other Entity. It will be registered under this user’s SWID.")]),
+        HSMLValidator("Person", ["name", "birthDate", "email"],
+                      warn_if_missing=[(["affiliation"], "'affiliation' field is missing.")]),
+        HSMLValidator("Agent", ["name", "creator", "dateCreated", "dateModified", "description"]),
+        HSMLValidator("Credential", ["name", "description", "issuedBy", "accessAuthorization", "authorizedForDomain"],
+                      nested_required=[("issuedBy", "swid"), ("authorizedForDomain", "swid"), ("accessAuthorization", "swid")],
+                      warn_if_missing=[(["validFrom", "validUntil"], "Credential has no expiration date.")]),
+        HSMLValidator("Organization", ["name", "description", "url", "address", "foundingDate", "email"]),
+    )
+}
+
+# Function to reject raw text that cannot be HSML before spending time parsing it
+def might_be_hsml(text):
+    return HSML_CONTEXT_MARKER in text
+
+# Function to check the @context references HSML (same rule as before: substring of a string, member of a list)
+def has_hsml_context(data):
+    context = data.get("@context")
+    if context is None:
+        return False
+    if context == HSML_CONTEXT:
+        return True
+    try:
+        return HSML_CONTEXT in context
+    except TypeError:
+        return False
+
+# Function to validate a loaded HSML document
+def validate_hsml(data):
+    """Returns (entity_type, errors, warnings); the document can be registered when errors is empty"""
+    if not isinstance(data, dict):
+        return None, ["Uploaded file is not a valid JSON object"], []
+    if not has_hsml_context(data):
+        return None, ["Not a valid HSML JSON"], []
+    entity_type = data.get("@type")
+    validator = VALIDATORS.get(entity_type) if isinstance(entity_type, str) else None
+    if validator is None:
+        return entity_type, ["Unknown or missing entity type"], []
+    errors, warnings = validator.validate(data)
+    return entity_type, errors, warnings
@@ -0,0 +1,107 @@
+import threading
+import time
+from concurrent.futures import Future
+from confluent_kafka import KafkaException, Producer
+
+
+class AsyncProducer:
+    """Non-blocking Kafka producer: send() returns a Future resolved by the delivery report.
+
+    Messages are batched by librdkafka (linger.ms / batch.size / compression.type)
+    and only flushed when a caller asks for it or on close(). A background thread
+    serves delivery callbacks and keeps per-topic delivery latency and error counters.
+    """
+
+    def __init__(self, config=None, linger_ms=5, batch_size=65536, compression="lz4", poll_interval=0.1, producer=None):
+        if producer is None:
+            producer_config = dict(config or {})
+            producer_config.setdefault("linger.ms", linger_ms)
+            producer_config.setdefault("batch.size", batch_size)
+            producer_config.setdefault("compression.type", compression)
+            producer = Producer(producer_config)
+        self._producer = producer
+        self.poll_interval = poll_interval
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._poll_loop, name="kafka-delivery-reports", daemon=True)
+        self._thread.start()
+
+    def send(self, topic, value, key=None, headers=None, callback=None):
+        """Queues a message and returns a Future resolved with the delivered message (or its error)"""
+        future = Future()
+        future.set_running_or_notify_cancel()
+        sent_at = time.perf_counter_ns()
+        self._count(topic, "sent")
+
+        def on_delivery(err, msg):
+            latency_ms = (time.perf_counter_ns() - sent_at) / 1e6
+            if err is not None:
+                self._count(topic, "errors", last_error=str(err))
+                future.set_exception(KafkaException(err))
+            else:
+                self._count(topic, "delivered", latency_ms=latency_ms)
+                future.set_result(msg)
+            if callback is not None:
+                callback(err, msg)
+
+        while True:
+            try:
+                self._producer.produce(topic, value, key=key, headers=headers, on_delivery=on_delivery)
+                break
+            except BufferError:
+                # Local queue is full: let delivery reports drain it, then retry
+                self._producer.poll(self.poll_interval)
+            except Exception as e:
+                self._count(topic, "errors", last_error=str(e))
+                future.set_exception(e)
+                break
+        return future
+
+    def flush(self, timeout=None):
+        """Blocks until every queued message is delivered; returns the number still in flight"""
+        return self._producer.flush() if timeout is None else self._producer.flush(timeout)
+
+    def close(self, timeout=10):
+        """Flushes for up to `timeout` seconds, then drops what is left and shuts the client down; returns the number dropped"""
+        if self._stopped.is_set():
+            return 0
+        remaining = self.flush(timeout)
+        if remaining and hasattr(self._producer, "purge"):
+            self._producer.purge()
+        self._stopped.set()
+        self._thread.join()
+        # Stops librdkafka's broker connections now instead of whenever the Producer is garbage collected
+        if hasattr(self._producer, "close"):
+            self._producer.close()
+        return remaining
+
+    def stats(self):
+        """Per-topic counters: sent, delivered, errors, in_flight, latency_ms_avg, latency_ms_max, last_error"""
+        with self._stats_lock:
+            report = {}
+            for topic, counters in self._stats.items():
+                topic_report = dict(counters)
+                delivered = counters["delivered"]
+                topic_report["in_flight"] = counters["sent"] - delivered - counters["errors"]
+                topic_report["latency_ms_avg"] = counters["latency_ms_total"] / delivered if delivered else 0.0
+                del topic_report["latency_ms_total"]
+                report[topic] = topic_report
+            return report
+
+    def _count(self, topic, counter, latency_ms=None, last_error=None):
+        with self._stats_lock:
+            counters = self._stats.get(topic)
+            if counters is None:
+                counters = self._stats[topic] = {"sent": 0, "delivered": 0, "errors": 0, "latency_ms_total": 0.0,
+                                                 "latency_ms_max": 0.0, "last_error": None}
+            counters[counter] += 1
+            if latency_ms is not None:
+                counters["latency_ms_total"] += latency_ms
+                counters["latency_ms_max"] = max(counters["latency_ms_max"], latency_ms)
+            if last_error is not None:
+                counters["last_error"] = last_error
+
+    def _poll_loop(self):
+        while not self._stopped.is_set():
+            self._producer.poll(self.poll_interval)
@@ -0,0 +1,6 @@
+# Function run in the worker processes of did_keygen.generate_did_key_pairs: one chunk of fresh key pairs.
+# It lives in a module of its own so a worker can unpickle it by name even when did_keygen.py is the main
+# script, and nothing here runs on import.
+def generate_did_key_pairs_chunk(count):
+    from did_keygen import generate_did_key_pair  # did_keygen imports this module
+    return [generate_did_key_pair() for _ in range(count)]
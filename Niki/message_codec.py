@@ -0,0 +1,113 @@
+import json
+
+# Registry Kafka messages carry three headers next to the encoded value:
+#   content-type    how the value is encoded (application/json or application/msgpack)
+#   schema          what the message is, e.g. hsml.agent_registered
+#   schema-version  version of that schema, bumped on incompatible changes
+# Consumers decode with decode_message(), which also accepts messages sent before the headers
+# existed (plain JSON text).
+CONTENT_TYPE_HEADER = "content-type"
+SCHEMA_HEADER = "schema"
+SCHEMA_VERSION_HEADER = "schema-version"
+
+# Schemas of the messages the registry publishes, with their current versions
+AGENT_REGISTERED = "hsml.agent_registered"
+SCHEMA_VERSIONS = {
+    AGENT_REGISTERED: 1,
+}
+
+
+class JsonCodec:
+    """Standard library JSON, compact separators"""
+
+    name = "json"
+    content_type = "application/json"
+
+    def encode(self, message):
+        return json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def decode(self, value):
+        return json.loads(value)
+
+
+class OrjsonCodec(JsonCodec):
+    """Same JSON on the wire as JsonCodec, encoded and decoded several times faster"""
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson  # Only needed when this codec is chosen
+        self._orjson = orjson
+
+    def encode(self, message):
+        return self._orjson.dumps(message)
+
+    def decode(self, value):
+        return self._orjson.loads(value)
+
+
+class MsgPackCodec:
+    """MessagePack: binary, smallest on the wire (numbers and short strings especially)"""
+
+    name = "msgpack"
+    content_type = "application/msgpack"
+
+    def __init__(self):
+        import msgpack  # Only needed when this codec is chosen
+        self._msgpack = msgpack
+
+    def encode(self, message):
+        return self._msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, value):
+        return self._msgpack.unpackb(value, raw=False)
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec, OrjsonCodec, MsgPackCodec)}
+
+_instances = {}
+
+# Function to get a codec by name ("json", "orjson" or "msgpack")
+def get_codec(name):
+    """Raises ValueError for an unknown name and ImportError when the codec's package is not installed"""
+    codec = _instances.get(name)
+    if codec is None:
+        if name not in CODECS:
+            raise ValueError(f"Unknown message codec: {name} (expected one of {', '.join(CODECS)})")
+        codec = _instances[name] = CODECS[name]()
+    return codec
+
+# Function to pick the decoder for a content type: orjson for JSON when it is installed
+def codec_for_content_type(content_type):
+    if content_type == MsgPackCodec.content_type:
+        return get_codec("msgpack")
+    if content_type in (None, JsonCodec.content_type):
+        try:
+            return get_codec("orjson")
+        except ImportError:
+            return get_codec("json")
+    raise ValueError(f"Unsupported message content type: {content_type}")
+
+# Function to encode a registry message with its headers
+def encode_message(message, schema=None, codec="json"):
+    """Returns (value, headers) for AsyncProducer.send; headers is a list of (name, bytes) pairs"""
+    codec = get_codec(codec) if isinstance(codec, str) else codec
+    headers = [(CONTENT_TYPE_HEADER, codec.content_type.encode("ascii"))]
+    if schema is not None:
+        headers.append((SCHEMA_HEADER, schema.encode("utf-8")))
+        headers.append((SCHEMA_VERSION_HEADER, str(SCHEMA_VERSIONS.get(schema, 1)).encode("ascii")))
+    return codec.encode(message), headers
+
+# Function to decode a registry message on the consumer side
+def decode_message(value, headers=None):
+    """Returns (message, schema, schema_version); schema and version are None for messages sent without them"""
+    header_values = {}
+    for name, header_value in headers or ():
+        header_values[name.lower()] = header_value.decode("utf-8") if isinstance(header_value, bytes) else header_value
+    message = codec_for_content_type(header_values.get(CONTENT_TYPE_HEADER)).decode(value)
+    version = header_values.get(SCHEMA_VERSION_HEADER)
+    return message, header_values.get(SCHEMA_HEADER), int(version) if version is not None else None
+
+# Function to decode a consumed confluent_kafka Message
+def decode_kafka_message(msg):
+    return decode_message(msg.value(), msg.headers())
@@ -0,0 +1,246 @@
+import argparse
+import threading
+import time
+
+# Kafka messages (and the Agent topics they need) are written to kafka_outbox in the same
+# transaction as the registration, and a relay thread publishes them after the commit. A
+# registration therefore waits on the database only, and a message exists if and only if its
+# registration committed. Delivery is at least once: a row is deleted only after Kafka
+# acknowledged it, so a crash between the two sends it again.
+
+# Rows read, published and acknowledged per round
+OUTBOX_BATCH_SIZE = 500
+
+# Retry delay after the n-th failed attempt: OUTBOX_RETRY_BASE_SECONDS * 2 ** (n - 1), capped
+OUTBOX_RETRY_BASE_SECONDS = 1.0
+OUTBOX_RETRY_MAX_SECONDS = 60.0
+
+# Function to queue messages in the caller's transaction
+def enqueue_messages(cursor, messages, available_at=None):
+    """messages are (topic, key, payload, create_topic, schema) tuples: payload is the message as JSON (encoded with
+    the configured codec when published), create_topic makes the relay create the topic first"""
+    available_at = time.time() if available_at is None else available_at
+    cursor.executemany(
+        "INSERT INTO kafka_outbox (topic, message_key, payload, create_topic, message_schema, available_at) VALUES (%s, %s, %s, %s, %s, %s)",
+        [(topic, key, payload, 1 if create_topic else 0, schema, available_at) for topic, key, payload, create_topic, schema in messages]
+    )
+
+# Function to read the oldest messages that are due
+def fetch_due_messages(cursor, limit=OUTBOX_BATCH_SIZE, now=None):
+    """Returns (id, topic, key, payload, create_topic, schema, attempts) rows, oldest first"""
+    cursor.execute(
+        "SELECT id, topic, message_key, payload, create_topic, message_schema, attempts FROM kafka_outbox "
+        "WHERE available_at <= %s ORDER BY id LIMIT %s",
+        (time.time() if now is None else now, limit)
+    )
+    return cursor.fetchall()
+
+# Function to remove published messages
+def delete_messages(cursor, ids):
+    cursor.executemany("DELETE FROM kafka_outbox WHERE id = %s", [(message_id,) for message_id in ids])
+
+# Function to put failed messages back with their next attempt time
+def schedule_retries(cursor, retries):
+    """retries are (id, attempts, error, available_at) tuples"""
+    cursor.executemany(
+        "UPDATE kafka_outbox SET attempts = %s, last_error = %s, available_at = %s WHERE id = %s",
+        [(attempts, error[:1000], available_at, message_id) for message_id, attempts, error, available_at in retries]
+    )
+
+# Function to count the messages not yet published
+def count_pending(cursor):
+    cursor.execute("SELECT COUNT(*) FROM kafka_outbox")
+    return cursor.fetchone()[0]
+
+
+class OutboxRelay:
+    """Publishes kafka_outbox rows on a background thread, in batches, retrying failures with backoff.
+
+    `send(topic, payload, key, schema)` encodes the message and returns a Future resolved on
+    delivery; `create_topics(names)` returns the names that exist afterwards. The thread starts on
+    the first wake() and then drains whatever is due, including rows left by a previous process.
+    Rows are not locked while in flight, so run one relay per registry database (set autostart
+    False in the other processes); a second one only causes duplicate deliveries.
+    """
+
+    def __init__(self, storage, send, create_topics, batch_size=OUTBOX_BATCH_SIZE, poll_interval=1.0,
+                 send_timeout=30.0, retry_base=OUTBOX_RETRY_BASE_SECONDS, retry_max=OUTBOX_RETRY_MAX_SECONDS):
+        self.storage = storage
+        self.send = send
+        self.create_topics = create_topics
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.send_timeout = send_timeout
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        # False when a separate process relays this registry's outbox: wake() then does nothing
+        self.autostart = True
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._start_lock = threading.Lock()
+        self._round_lock = threading.Lock()  # One round at a time, whether from the thread or drain()
+        self._thread = None
+        self.delivered = 0
+        self.failed = 0
+        self.topics_ready = 0
+        self.last_error = None
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._relay_loop, name="kafka-outbox-relay", daemon=True)
+            self._thread.start()
+        return self
+
+    def wake(self):
+        """Called after a commit that queued messages: publish them now instead of at the next poll"""
+        if self._thread is None:
+            if not self.autostart:
+                return
+            self.start()
+        self._wakeup.set()
+
+    def retry_delay(self, attempts):
+        return min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+
+    def run_once(self):
+        """Publishes one batch of due messages; returns the number of rows read"""
+        with self._round_lock:
+            with self.storage.transaction() as cursor:
+                rows = fetch_due_messages(cursor, self.batch_size)
+            if not rows:
+                return 0
+
+            failures = {}
+            needed_topics = sorted({row[1] for row in rows if row[4]})
+            ready_topics = set()
+            if needed_topics:
+                try:
+                    ready_topics = set(self.create_topics(needed_topics))
+                except Exception as e:
+                    self.last_error = f"Topic creation failed: {e}"
+                self.topics_ready += len(ready_topics)
+
+            in_flight = []
+            for message_id, topic, key, payload, create_topic, schema, attempts in rows:
+                if create_topic and topic not in ready_topics:
+                    failures[message_id] = (attempts, f"Topic '{topic}' could not be created")
+                    continue
+                try:
+                    in_flight.append((message_id, attempts, self.send(topic, payload, key, schema)))
+                except Exception as e:
+                    failures[message_id] = (attempts, str(e))
+
+            delivered = []
+            deadline = time.monotonic() + self.send_timeout
+            for message_id, attempts, future in in_flight:
+                try:
+                    future.result(timeout=max(0.0, deadline - time.monotonic()))
+                    delivered.append(message_id)
+                except Exception as e:
+                    # Includes a timeout: the message may still arrive, and will then arrive twice
+                    failures[message_id] = (attempts, str(e) or type(e).__name__)
+
+            now = time.time()
+            retries = [(message_id, attempts + 1, error, now + self.retry_delay(attempts + 1))
+                       for message_id, (attempts, error) in failures.items()]
+            with self.storage.transaction() as cursor:
+                if delivered:
+                    delete_messages(cursor, delivered)
+                if retries:
+                    schedule_retries(cursor, retries)
+            self.delivered += len(delivered)
+            self.failed += len(retries)
+            if retries:
+                self.last_error = retries[-1][2]
+            return len(rows)
+
+    def drain(self):
+        """Publishes everything that is due now; stops early when a round delivers nothing. Returns the rows left."""
+        while True:
+            delivered = self.delivered
+            if self.run_once() == 0 or self.delivered == delivered:
+                break
+        return self.pending()
+
+    def pending(self):
+        with self.storage.transaction() as cursor:
+            return count_pending(cursor)
+
+    def _relay_loop(self):
+        while not self._stopped.is_set():
+            try:
+                read = self.run_once()
+            except Exception as e:
+                self.last_error = str(e)
+                read = 0
+            # A full batch means more are probably due: go again straight away
+            if read < self.batch_size:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """Stops the thread after a last attempt at publishing what is due; returns the rows left for next time"""
+        started = self._thread is not None
+        self.stop()
+        if not started:
+            return None
+        try:
+            return self.drain()
+        except Exception as e:
+            print(f"Kafka outbox not drained: {e}")
+            return None
+
+    def stats(self):
+        return {"delivered": self.delivered, "failed": self.failed, "topics_ready": self.topics_ready, "last_error": self.last_error}
+
+    def reset_stats(self):
+        """Zeroes the counters stats() reports, e.g. between benchmark scenarios"""
+        with self._round_lock:
+            self.delivered = 0
+            self.failed = 0
+            self.topics_ready = 0
+            self.last_error = None
+
+
+def main():
+    from registration_api import load_registration_api
+
+    parser = argparse.ArgumentParser(description="Publish the registry's Kafka outbox (run one relay per registry database)")
+    parser.add_argument("--api", help="Path of the Registration API script (defaults to the current version)")
+    parser.add_argument("--once", action="store_true", help="Publish whatever is due, print how many rows are left and exit")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"], help="Registry storage backend (defaults to the API's)")
+    parser.add_argument("--sqlite-path", help="Registry file for the sqlite backend")
+    args = parser.parse_args()
+
+    api = load_registration_api(args.api)
+    if args.backend:
+        api.storage.close()
+        api.storage = api.open_storage(args.backend, mysql_config=api.db_config, sqlite_path=args.sqlite_path or api.REGISTRY_SQLITE_PATH,
+                                       pool_size=api.DB_POOL_SIZE)
+        api.outbox_relay.storage = api.storage
+    relay = api.outbox_relay
+    if args.once:
+        print(f"{relay.drain()} messages left in the outbox ({relay.delivered} published, {relay.failed} failed)")
+        return
+    relay.start()
+    print("Relaying the Kafka outbox, Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(60)
+            print(relay.stats())
+    except KeyboardInterrupt:
+        relay.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import json
+import os
+import queue
+import tempfile
+import threading
+
+
+class OutputWriteError(OSError):
+    """Queued output files that could not be written; `failures` lists (path, error message) pairs"""
+
+    def __init__(self, failures):
+        super().__init__(f"{len(failures)} output file(s) could not be saved: " + "; ".join(f"{path}: {error}" for path, error in failures))
+        self.failures = failures
+
+
+class OutputWriter:
+    """Writes registration output files on a background thread, off the request path.
+
+    Files are written atomically: to a temporary file in the same directory, then renamed over
+    the target, so readers never see a half-written JSON or key. The queue is bounded; when the
+    disk falls behind, callers block on enqueue instead of buffering without limit. One worker
+    thread keeps writes in submission order, so the last update to a file wins.
+
+    Private keys are the exception: they are written before write_private_key returns and a
+    failure raises to the caller. Failed JSON writes are raised by the next flush().
+    """
+
+    def __init__(self, max_queue=1000, compact=False, indent=4, fsync=False):
+        self.compact = compact
+        self.indent = indent
+        self.fsync = fsync
+        # Mode open() would give a new file; mkstemp always uses 0600
+        self.file_mode = 0o666 & ~_umask()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self.written = 0
+        self.errors = 0
+        self.last_error = None
+        self._failures = []  # (path, error message) not yet raised by flush()
+        self._thread = threading.Thread(target=self._write_loop, name="output-writer", daemon=True)
+        self._thread.start()
+
+    def write_json(self, path, data):
+        """Queues data to be saved as JSON (pretty-printed unless compact); returns immediately"""
+        self._queue.put((path, data, None))
+
+    def write_text(self, path, text, mode=None):
+        self._queue.put((path, text, mode))
+
+    def write_private_key(self, path, private_key_pem):
+        """Saves a private key (owner-only permissions) before returning; raises OSError when it cannot.
+
+        The file is the only copy of the key and callers log in with it straight away, so it is not queued.
+        """
+        try:
+            self._write_atomic(path, private_key_pem, 0o600)
+        except OSError as e:
+            with self._lock:
+                self.errors += 1
+                self.last_error = f"{path}: {e}"
+            raise
+        with self._lock:
+            self.written += 1
+
+    def _serialize(self, content):
+        if isinstance(content, str):
+            return content
+        if self.compact:
+            return json.dumps(content, separators=(",", ":"))
+        return json.dumps(content, indent=self.indent)
+
+    def _write_atomic(self, path, content, mode):
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as temp_file:
+                temp_file.write(self._serialize(content))
+                if self.fsync:
+                    temp_file.flush()
+                    os.fsync(temp_file.fileno())
+            os.chmod(temp_path, mode if mode is not None else self.file_mode)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                path, content, mode = item
+                try:
+                    self._write_atomic(path, content, mode)
+                    with self._lock:
+                        self.written += 1
+                except Exception as e:
+                    with self._lock:
+                        self.errors += 1
+                        self.last_error = f"{path}: {e}"
+                        self._failures.append((path, str(e)))
+                    print(f"Failed to save {path}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Blocks until every queued file has been written; raises OutputWriteError for those that failed since the last flush"""
+        self._queue.join()
+        with self._lock:
+            failures, self._failures = self._failures, []
+        if failures:
+            raise OutputWriteError(failures)
+
+    def close(self):
+        """Writes whatever is queued, then stops the worker thread"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {"queued": self._queue.qsize(), "written": self.written, "errors": self.errors, "last_error": self.last_error}
+
+
+def _umask():
+    # os.umask can only be read by setting it, so set it back straight away (done once, at construction)
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
@@ -0,0 +1,23 @@
+import importlib.util
+import os
+import sys
+
+# Current version of the Registration API script (its file name is not importable as a module)
+REGISTRATION_API_FILE = "Registration_API_v7(with time stamps for tests) - Niki.py"
+
+# Function to import a Registration API script by path
+def load_registration_api(path=None, module_name="registration_api_v7"):
+    """Imports the Registration API script once and returns the module (cached in sys.modules)"""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), REGISTRATION_API_FILE)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except Exception:
+        del sys.modules[module_name]
+        raise
+    return module
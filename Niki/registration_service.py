@@ -0,0 +1,318 @@
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+from entity_index import DEFAULT_PAGE_SIZE
+from registration_api import load_registration_api
+
+# Largest request body accepted, in bytes
+MAX_BODY_BYTES = 1024 * 1024
+
+HTTP_REASONS = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class RegistrationService:
+    """Serves the Registration API over HTTP/1.1 from one asyncio event loop.
+
+        POST /register   {"document": {...}, "private_key_pem": ..., "overwrite": false, "domain_private_key_pem": ...,
+                          "on_duplicate": "update" | "reject" | "off"}
+        POST /login      {"private_key_pem": ...}  returns a session token
+        POST /logout     ends the session
+        GET  /did/<did>
+        GET  /entities?type=&registered_by=&name=&name_prefix=&linked_to=&relation=&after=&limit=&metadata=1
+                         one page of matching entities, ordered by DID; pass next_after back as after
+        GET  /access?domain=&grantee=
+                         whether grantee reaches domain through one or more grants (access_closure)
+        GET  /metrics    per-stage latency histograms in Prometheus text format
+
+    Parsing and routing run on the event loop. Every blocking DB, Kafka or key call runs on a
+    thread pool of `workers` threads; at most `max_pending` requests queue for a worker and any
+    beyond that are answered 503 straight away instead of piling up.
+
+    /register and /logout take the session token from "Authorization: Bearer <token>" or a
+    "session_token" field; with a token, registering needs no private key.
+    """
+
+    def __init__(self, api, workers=32, max_pending=1024):
+        self.api = api
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="registration")
+        self._pending = 0  # Only touched on the event loop thread
+        self._server = None
+
+    # ---- Blocking handlers (run on the executor) ----
+
+    def _register(self, body):
+        document = body.get("document")
+        if not isinstance(document, dict):
+            raise HTTPError(400, "'document' must be an HSML JSON object")
+        registered_by = None
+        if body.get("session_token"):
+            session = self.api.session_user(body["session_token"])
+            if session is None:
+                raise HTTPError(401, "Session expired or invalid, please log in again.")
+            registered_by = session[0]
+        elif body.get("private_key_pem"):
+            registered_by, _, error = self.api.authenticate(private_key_pem=body["private_key_pem"])
+            if error:
+                raise HTTPError(401, error)
+        elif document.get("@type") not in ["Person", "Organization"]:
+            raise HTTPError(401, "You can only register a Person or Organization as a new user.")
+        # Overwriting is destructive: only a JSON true turns it on, never a string such as "false"
+        overwrite = body.get("overwrite", False)
+        if not isinstance(overwrite, bool):
+            raise HTTPError(400, "'overwrite' must be true or false")
+        # Credentials prove ownership of the Domain; without its key register_document would prompt
+        if document.get("@type") == "Credential" and not body.get("domain_private_key_pem"):
+            raise HTTPError(400, "'domain_private_key_pem' is required to register a Credential")
+
+        result = self.api.register_document(
+            document,
+            registered_by=registered_by,
+            overwrite=overwrite,
+            domain_private_key_pem=body.get("domain_private_key_pem"),
+            write_files=False,
+            on_duplicate=body.get("on_duplicate")
+        )
+        return (201 if result["status"] == "success" else 400), result
+
+    def _login(self, body):
+        if not body.get("private_key_pem"):
+            raise HTTPError(400, "'private_key_pem' is required")
+        token, user_did, user_data, error = self.api.start_session(private_key_pem=body["private_key_pem"])
+        if error:
+            raise HTTPError(401, error)
+        return 200, {
+            "status": "success",
+            "did": user_did,
+            "name": user_data.get("name"),
+            "@type": user_data.get("@type"),
+            "session_token": token,
+            "expires_in": self.api.SESSION_TTL_SECONDS
+        }
+
+    def _logout(self, body):
+        if not body.get("session_token"):
+            raise HTTPError(400, "No session token given")
+        self.api.session_manager.revoke(body["session_token"])
+        return 200, {"status": "success", "message": "Logged out"}
+
+    def _lookup(self, did):
+        data = self.api.storage.get_metadata(did)
+        if data is None:
+            raise HTTPError(404, f"DID not registered: {did}")
+        return 200, data
+
+    def _query(self, params):
+        try:
+            limit = int(params.get("limit", DEFAULT_PAGE_SIZE))
+            return 200, self.api.storage.query(
+                entity_type=params.get("type"),
+                registered_by=params.get("registered_by"),
+                name=params.get("name"),
+                name_prefix=params.get("name_prefix"),
+                linked_to=params.get("linked_to"),
+                relation=params.get("relation", "linkedTo"),
+                after=params.get("after"),
+                limit=limit,
+                include_metadata=params.get("metadata") in ("1", "true")
+            )
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+
+    def _access(self, params):
+        if not params.get("domain") or not params.get("grantee"):
+            raise HTTPError(400, "'domain' and 'grantee' are required")
+        return 200, {"domain": params["domain"], "grantee": params["grantee"],
+                     "access": self.api.storage.can_reach(params["domain"], params["grantee"])}
+
+    # ---- Event loop side ----
+
+    async def run_blocking(self, function, *args):
+        if self._pending >= self.max_pending:
+            raise HTTPError(503, "Too many registrations in progress, retry later")
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            self._pending -= 1
+
+    async def dispatch(self, method, target, body, headers=None):
+        """Returns (status, payload); payload is a dict sent as JSON or a str sent as text"""
+        url = urlsplit(target)
+        path = url.path
+        if path == "/metrics":
+            if method != "GET":
+                raise HTTPError(405, "Use GET")
+            return 200, self.api.registration_timer.to_prometheus()
+        if path.startswith("/did/"):
+            if method != "GET":
+                raise HTTPError(405, "Use GET")
+            return await self.run_blocking(self._lookup, unquote(path[len("/did/"):]))
+        if path == "/entities":
+            if method != "GET":
+                raise HTTPError(405, "Use GET")
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            return await self.run_blocking(self._query, params)
+        if path == "/access":
+            if method != "GET":
+                raise HTTPError(405, "Use GET")
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            return await self.run_blocking(self._access, params)
+        handler = {"/register": self._register, "/login": self._login, "/logout": self._logout}.get(path)
+        if handler is None:
+            raise HTTPError(404, f"No such endpoint: {path}")
+        if method != "POST":
+            raise HTTPError(405, "Use POST")
+        try:
+            request = json.loads(body or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise HTTPError(400, "Request body is not valid JSON")
+        if not isinstance(request, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        authorization = (headers or {}).get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            request["session_token"] = authorization[len("bearer "):].strip()
+        return await self.run_blocking(handler, request)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                try:
+                    length = self.content_length(headers)
+                except HTTPError as e:
+                    status, payload = e.status, {"status": "error", "message": str(e)}
+                    keep_alive = False  # The unread body is still on the socket
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    try:
+                        status, payload = await self.dispatch(method.upper(), target, body, headers)
+                    except HTTPError as e:
+                        status, payload = e.status, {"status": "error", "message": str(e)}
+                    except ValueError as e:
+                        # Malformed keys and the like
+                        status, payload = 400, {"status": "error", "message": str(e)}
+                    except Exception as e:
+                        status, payload = 500, {"status": "error", "message": f"Registration failed: {e}"}
+
+                writer.write(self.encode_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def content_length(headers):
+        value = headers.get("content-length") or "0"
+        try:
+            length = int(value)
+        except ValueError:
+            raise HTTPError(400, f"Invalid Content-Length: {value}")
+        if length < 0:
+            raise HTTPError(400, f"Invalid Content-Length: {value}")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f"Request body is larger than {MAX_BODY_BYTES} bytes")
+        return length
+
+    @staticmethod
+    def encode_response(status, payload, keep_alive):
+        if isinstance(payload, str):
+            content_type, content = "text/plain; version=0.0.4", payload.encode("utf-8")
+        else:
+            content_type, content = "application/json", json.dumps(payload).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(content)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        return head.encode("latin-1") + content
+
+    async def start(self, host="127.0.0.1", port=8080):
+        self._server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        return self._server
+
+    async def serve_forever(self, host="127.0.0.1", port=8080):
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        self.executor.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve HSML registration, login and DID lookup over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=32, help="Threads running blocking DB and Kafka work")
+    parser.add_argument("--max-pending", type=int, default=1024, help="Requests allowed to wait for a worker before answering 503")
+    parser.add_argument("--api", help="Path of the Registration API script to serve (defaults to the current version)")
+    parser.add_argument("--no-relay", action="store_true",
+                        help="Leave the Kafka outbox to a separate outbox_relay.py process (when several services share a registry)")
+    args = parser.parse_args()
+
+    api = load_registration_api(args.api)
+    # One pooled connection per worker, so workers never queue on the pool
+    if args.workers > api.storage.pool.size:
+        api.storage.set_pool_size(args.workers)
+    # Load the DID/topic existence filter now rather than on the first registration
+    api.registry_filter.ensure_loaded(api.db_cursor)
+    if api.AGENT_TOPIC_MODE == "dedicated":
+        api.topic_pool.start()  # In the background: requests never wait for the broker to fill it
+    if args.no_relay:
+        api.outbox_relay.autostart = False
+    else:
+        api.outbox_relay.start()  # Also publishes whatever a previous run left in the outbox
+
+    service = RegistrationService(api, workers=args.workers, max_pending=args.max_pending)
+    print(f"Registration service listening on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(service.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import argparse
+import gzip
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# A registry dump is NDJSON, one object per line, tagged by "table":
+#   {"table": "registry_dump", "format_version": 1, ...}           header
+#   {"table": "did_keys", "did": ..., "metadata": {...}, ...}       one line per entity
+#   {"table": "domain_access", "domain_did": ..., ...}              one line per grant
+#   {"table": "end", "did_keys": <count>, "domain_access": <count>} trailer, missing when the dump was cut short
+# entity_type, name, entity_links and access_closure are derived data: they are rebuilt on import,
+# not exported. Files ending in .gz are compressed; "-" is stdout or stdin.
+DUMP_FORMAT_VERSION = 1
+
+# Rows per fetchmany() and per exported range
+EXPORT_CHUNK_SIZE = 5000
+# Rows per executemany() (and transaction) on import
+IMPORT_CHUNK_SIZE = 1000
+
+# Fields of a did_keys line, in RegistryStorage.upsert_many() row order
+DID_KEYS_FIELDS = ("did", "public_key", "metadata", "registered_by", "kafka_topic", "content_hash", "duplicate_key")
+DID_KEYS_SELECT = "SELECT did, public_key, metadata, registered_by, kafka_topic, content_hash, duplicate_key FROM did_keys"
+DOMAIN_ACCESS_SELECT = "SELECT domain_did, grantee_did, access_entry, granted_at FROM domain_access ORDER BY domain_did, grantee_did"
+
+# Function to open a dump file for reading ("r") or writing ("w")
+@contextmanager
+def open_dump(path, mode):
+    if path == "-":
+        yield sys.stdout if mode == "w" else sys.stdin
+    elif path.endswith(".gz"):
+        # Level 1: several times faster than the default and most of the size reduction on JSON
+        with gzip.open(path, mode + "t", encoding="utf-8", compresslevel=1) as dump:
+            yield dump
+    else:
+        with open(path, mode, encoding="utf-8") as dump:
+            yield dump
+
+# Function to turn a did_keys row into its dump line
+def did_keys_line(row):
+    did, public_key, metadata, registered_by, kafka_topic, content_hash, duplicate_key = row
+    if isinstance(metadata, (bytes, bytearray)):
+        metadata = metadata.decode("utf-8")
+    if metadata is None or "\n" in metadata:
+        metadata = json.dumps(json.loads(metadata)) if metadata else "null"
+    # The stored metadata is already JSON: splice it in instead of parsing and re-serializing every document
+    head = json.dumps({"table": "did_keys", "did": did, "public_key": public_key, "registered_by": registered_by,
+                       "kafka_topic": kafka_topic, "content_hash": content_hash, "duplicate_key": duplicate_key})
+    return f'{head[:-1]}, "metadata": {metadata}}}\n'
+
+# Function to turn a domain_access row into its dump line
+def domain_access_line(row):
+    domain_did, grantee_did, access_entry, granted_at = row
+    if isinstance(access_entry, (bytes, bytearray)):
+        access_entry = access_entry.decode("utf-8")
+    return json.dumps({"table": "domain_access", "domain_did": domain_did, "grantee_did": grantee_did,
+                       "access_entry": json.loads(access_entry) if access_entry else None,
+                       "granted_at": str(granted_at) if granted_at is not None else None}) + "\n"
+
+# Function to read a query's rows chunk by chunk
+def stream_rows(cursor, statement, params=(), chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields lists of at most chunk_size rows. On MySQL the pooled cursors are unbuffered, so rows
+    are pulled from the server as they are fetched instead of being loaded all at once."""
+    cursor.execute(statement, params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+# Function to find where each range of chunk_size DIDs ends, walking the primary key index only
+def did_ranges(storage, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields (after, last) pairs: the range is after < did <= last, with after None for the first range
+    and last None for the final one"""
+    after = None
+    with storage.transaction() as cursor:
+        while True:
+            if after is None:
+                cursor.execute("SELECT did FROM did_keys ORDER BY did LIMIT 1 OFFSET %s", (chunk_size - 1,))
+            else:
+                cursor.execute("SELECT did FROM did_keys WHERE did > %s ORDER BY did LIMIT 1 OFFSET %s", (after, chunk_size - 1))
+            row = cursor.fetchone()
+            yield after, (row[0] if row else None)
+            if row is None:
+                return
+            after = row[0]
+
+# Function to read one range of DIDs as dump text
+def export_range(storage, after, last):
+    conditions, params = [], []
+    if after is not None:
+        conditions.append("did > %s")
+        params.append(after)
+    if last is not None:
+        conditions.append("did <= %s")
+        params.append(last)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    with storage.transaction() as cursor:
+        cursor.execute(f"{DID_KEYS_SELECT}{where} ORDER BY did", params)
+        rows = cursor.fetchall()
+    return "".join(did_keys_line(row) for row in rows), len(rows)
+
+# Function to write the registry to a dump
+def export_registry(storage, output, chunk_size=EXPORT_CHUNK_SIZE, workers=1):
+    """Writes the header, every did_keys and domain_access row and the trailer to the text stream `output`.
+
+    With one worker the whole dump is read in one transaction: a consistent snapshot on MySQL, and
+    SQLite in WAL mode does not block registrations meanwhile. With more, did_keys is read as
+    ranges of chunk_size DIDs in parallel, each range in a transaction of its own, so export a
+    registry nothing is writing to, from a storage pool of workers + 1 connections. At most
+    2 * workers ranges are held in memory. Returns the row counts.
+    """
+    counts = {"did_keys": 0, "domain_access": 0}
+    output.write(json.dumps({"table": "registry_dump", "format_version": DUMP_FORMAT_VERSION,
+                             "backend": storage.backend, "exported_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}) + "\n")
+    if workers <= 1:
+        with storage.transaction() as cursor:
+            for rows in stream_rows(cursor, f"{DID_KEYS_SELECT} ORDER BY did", chunk_size=chunk_size):
+                output.write("".join(did_keys_line(row) for row in rows))
+                counts["did_keys"] += len(rows)
+            for rows in stream_rows(cursor, DOMAIN_ACCESS_SELECT, chunk_size=chunk_size):
+                output.write("".join(domain_access_line(row) for row in rows))
+                counts["domain_access"] += len(rows)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="registry-export") as executor:
+            in_flight = []
+            # Ranges are written in DID order as they complete, keeping at most 2 * workers in flight
+            for after, last in did_ranges(storage, chunk_size):
+                in_flight.append(executor.submit(export_range, storage, after, last))
+                if len(in_flight) >= 2 * workers:
+                    text, count = in_flight.pop(0).result()
+                    output.write(text)
+                    counts["did_keys"] += count
+            for future in in_flight:
+                text, count = future.result()
+                output.write(text)
+                counts["did_keys"] += count
+        with storage.transaction() as cursor:
+            for rows in stream_rows(cursor, DOMAIN_ACCESS_SELECT, chunk_size=chunk_size):
+                output.write("".join(domain_access_line(row) for row in rows))
+                counts["domain_access"] += len(rows)
+    output.write(json.dumps({"table": "end", **counts}) + "\n")
+    return counts
+
+# Function to write a chunk of domain_access rows
+def insert_grants(storage, rows):
+    with storage.transaction() as cursor:
+        cursor.executemany(
+            "INSERT IGNORE INTO domain_access (domain_did, grantee_did, access_entry, granted_at) VALUES (%s, %s, %s, %s)",
+            rows
+        )
+
+# Function to load a dump into the registry
+def import_registry(storage, source, chunk_size=IMPORT_CHUNK_SIZE, workers=1, rebuild_access_closure=True):
+    """Reads a dump from the text stream `source` and writes it in chunks of chunk_size rows.
+
+    Entities are upserted (an existing DID's row is overwritten, a Kafka topic owned by another DID
+    raises ValueError) with their query columns and links, and
+    grants already present are kept. Each chunk is a transaction of its own, written by one of
+    `workers` threads (the storage pool needs that many connections); at most 2 * workers chunks
+    are read ahead. access_closure is rebuilt once at the end. Raises ValueError for a file that
+    is not a dump or was cut short, after importing what it holds. Returns the row counts.
+    """
+    header = json.loads(source.readline() or "null")
+    if not isinstance(header, dict) or header.get("table") != "registry_dump":
+        raise ValueError("Not a registry dump: the first line is not a registry_dump header")
+    if header.get("format_version") != DUMP_FORMAT_VERSION:
+        raise ValueError(f"Unsupported registry dump format version: {header.get('format_version')}")
+
+    counts = {"did_keys": 0, "domain_access": 0}
+    trailer = None
+    slots = threading.BoundedSemaphore(2 * workers)
+    errors = []
+
+    def write(function, rows):
+        try:
+            function(rows)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="registry-import") as executor:
+        def submit(function, rows):
+            slots.acquire()
+            if errors:
+                raise errors[0]
+            executor.submit(write, function, rows)
+
+        entities, grants = [], []
+        for line_number, line in enumerate(source, start=2):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            table = record.get("table")
+            if table == "did_keys":
+                entities.append(tuple(record.get(field) for field in DID_KEYS_FIELDS))
+                counts["did_keys"] += 1
+                if len(entities) >= chunk_size:
+                    submit(storage.upsert_many, entities)
+                    entities = []
+            elif table == "domain_access":
+                access_entry = record.get("access_entry")
+                grants.append((record["domain_did"], record["grantee_did"],
+                               json.dumps(access_entry) if access_entry is not None else None, record.get("granted_at")))
+                counts["domain_access"] += 1
+                if len(grants) >= chunk_size:
+                    submit(lambda rows: insert_grants(storage, rows), grants)
+                    grants = []
+            elif table == "end":
+                trailer = record
+            else:
+                raise ValueError(f"Line {line_number}: unknown table {table!r}")
+        if entities:
+            submit(storage.upsert_many, entities)
+        if grants:
+            submit(lambda rows: insert_grants(storage, rows), grants)
+    if errors:
+        raise errors[0]
+
+    if rebuild_access_closure and counts["domain_access"]:
+        counts["access_closure"] = storage.recompute_access_closure()
+    if trailer is None:
+        raise ValueError(f"Registry dump was cut short: no trailer after {counts['did_keys']} entities and {counts['domain_access']} grants")
+    if (trailer.get("did_keys"), trailer.get("domain_access")) != (counts["did_keys"], counts["domain_access"]):
+        raise ValueError(f"Registry dump is incomplete: the trailer lists {trailer.get('did_keys')} entities and "
+                         f"{trailer.get('domain_access')} grants, {counts['did_keys']} and {counts['domain_access']} were read")
+    return counts
+
+
+def main():
+    from registration_api import load_registration_api
+    from registry_storage import open_storage
+
+    parser = argparse.ArgumentParser(description="Export the DID registry to NDJSON, or import such a dump into a registry")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="Dump file (.gz to compress, - for stdout/stdin)")
+    parser.add_argument("--api", help="Path of the Registration API script (defaults to the current version)")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"], help="Registry storage backend (defaults to the API's)")
+    parser.add_argument("--sqlite-path", help="Registry file for the sqlite backend")
+    parser.add_argument("--workers", type=int, default=1, help="Ranges read, or chunks written, in parallel")
+    parser.add_argument("--chunk-size", type=int, help=f"Rows per chunk (default {EXPORT_CHUNK_SIZE} on export, {IMPORT_CHUNK_SIZE} on import)")
+    args = parser.parse_args()
+
+    api = load_registration_api(args.api)
+    backend = args.backend or api.REGISTRY_BACKEND
+    api.storage.close()
+    storage = open_storage(backend, mysql_config=api.db_config, sqlite_path=args.sqlite_path or api.REGISTRY_SQLITE_PATH,
+                           pool_size=max(args.workers, 1) + 1)
+    if args.command == "import":
+        # The dump may come from an older registry: make sure every table it fills exists. access_closure
+        # is rebuilt once the grants are in, not here as well
+        migrated = storage.migrate(rebuild_access_closure=False)
+    started = time.perf_counter()
+    try:
+        with open_dump(args.path, "w" if args.command == "export" else "r") as dump:
+            if args.command == "export":
+                counts = export_registry(storage, dump, chunk_size=args.chunk_size or EXPORT_CHUNK_SIZE, workers=args.workers)
+            else:
+                counts = import_registry(storage, dump, chunk_size=args.chunk_size or IMPORT_CHUNK_SIZE, workers=args.workers)
+                if "access_closure" not in counts and (migrated["allowed_did_grants"] or migrated["can_access_entries"]):
+                    counts["access_closure"] = storage.recompute_access_closure()  # Only migrate changed the grants
+    finally:
+        storage.close()
+    print(f"{args.command.capitalize()}ed {counts['did_keys']} entities and {counts['domain_access']} grants "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import json
+from content_hash import canonical_hash
+from entity_index import index_fields, replace_links
+
+# Tables of the did_registry database. Every statement is idempotent.
+MYSQL_SCHEMA = [
+    # One row per registered entity, as first created by the Registration API; the columns added
+    # since then come from MYSQL_ADDED_COLUMNS, so an empty database ends up like an upgraded one
+    """
+    CREATE TABLE IF NOT EXISTS did_keys (
+        did VARCHAR(255) NOT NULL PRIMARY KEY,
+        public_key TEXT NULL,
+        metadata MEDIUMTEXT NULL,
+        registered_by VARCHAR(255) NULL,
+        kafka_topic VARCHAR(255) NULL,
+        allowed_did TEXT NULL
+    )
+    """,
+    # One row per access grant: replaces the comma-separated did_keys.allowed_did column
+    """
+    CREATE TABLE IF NOT EXISTS domain_access (
+        domain_did VARCHAR(255) NOT NULL,
+        grantee_did VARCHAR(255) NOT NULL,
+        access_entry JSON NULL,
+        granted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (domain_did, grantee_did),
+        KEY idx_domain_access_grantee (grantee_did)
+    )
+    """,
+    # Every (domain, grantee) pair joined by a chain of domain_access grants, see access_control.py
+    """
+    CREATE TABLE IF NOT EXISTS access_closure (
+        domain_did VARCHAR(255) NOT NULL,
+        grantee_did VARCHAR(255) NOT NULL,
+        PRIMARY KEY (domain_did, grantee_did),
+        KEY idx_access_closure_grantee (grantee_did, domain_did)
+    )
+    """,
+    # One row per reference from an entity's metadata to another DID (linkedTo, authorizedForDomain, ...)
+    """
+    CREATE TABLE IF NOT EXISTS entity_links (
+        did VARCHAR(255) NOT NULL,
+        relation VARCHAR(64) NOT NULL,
+        target_did VARCHAR(255) NOT NULL,
+        PRIMARY KEY (did, relation, target_did),
+        KEY idx_entity_links_target (target_did, relation, did)
+    )
+    """,
+    # Kafka messages written with the registration that produced them, published by outbox_relay.py
+    """
+    CREATE TABLE IF NOT EXISTS kafka_outbox (
+        id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        topic VARCHAR(255) NOT NULL,
+        message_key VARCHAR(255) NULL,
+        payload MEDIUMTEXT NOT NULL,
+        message_schema VARCHAR(64) NULL,
+        create_topic TINYINT(1) NOT NULL DEFAULT 0,
+        attempts INT NOT NULL DEFAULT 0,
+        available_at DOUBLE NOT NULL,
+        last_error TEXT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        KEY idx_kafka_outbox_available (available_at, id)
+    )
+    """,
+    # Which process holds each pre-created Agent topic of topic_pool.py, and until when
+    """
+    CREATE TABLE IF NOT EXISTS pooled_topics (
+        kafka_topic VARCHAR(255) NOT NULL PRIMARY KEY,
+        owner VARCHAR(255) NOT NULL,
+        leased_until DOUBLE NOT NULL
+    )
+    """,
+]
+
+# Columns added after a table was first created: (table, column, definition)
+MYSQL_ADDED_COLUMNS = [
+    # The accessAuthorization object as registered, so the Domain's canAccess list lives outside its metadata blob
+    ("domain_access", "access_entry", "JSON NULL"),
+    # Canonical hash of the registered document, to answer resubmissions with the existing DID
+    ("did_keys", "content_hash", "CHAR(64) NULL"),
+    # content_hash scoped to the registrant (content_hash.duplicate_key), unique so concurrent resubmissions cannot both register
+    ("did_keys", "duplicate_key", "CHAR(64) NULL"),
+    # @type and name copied out of the metadata blob so entities can be queried by them
+    ("did_keys", "entity_type", "VARCHAR(64) NULL"),
+    ("did_keys", "name", "VARCHAR(255) NULL"),
+    # Schema of an outbox message (see message_codec), sent as a header
+    ("kafka_outbox", "message_schema", "VARCHAR(64) NULL"),
+]
+
+# Indexes added to existing tables: (table, index name, columns, kind)
+MYSQL_ADDED_INDEXES = [
+    # Agent topics are named after their DID; the index makes a clash fail loudly instead of sharing a topic
+    ("did_keys", "uniq_did_keys_kafka_topic", "(kafka_topic)", "UNIQUE INDEX"),
+    ("did_keys", "idx_did_keys_content_hash", "(content_hash)", "INDEX"),
+    ("did_keys", "uniq_did_keys_duplicate_key", "(duplicate_key)", "UNIQUE INDEX"),
+    # Entity queries; each index ends in did so pages are read in index order
+    ("did_keys", "idx_did_keys_type", "(entity_type, did)", "INDEX"),
+    ("did_keys", "idx_did_keys_registered_by", "(registered_by, entity_type, did)", "INDEX"),
+    ("did_keys", "idx_did_keys_name", "(name, did)", "INDEX"),
+]
+
+# Rows read, written and committed per page by the migrations
+MIGRATION_CHUNK_SIZE = 1000
+
+# Function to read did_keys a page at a time, each page in a transaction of its own
+def paged_rows(transaction, columns, condition, params=(), chunk_size=MIGRATION_CHUNK_SIZE):
+    """Yields (cursor, rows) pages in did order; whatever the caller writes with the cursor commits with its page.
+
+    Only one page is held in memory, and an interrupted migration keeps the pages it already committed.
+    """
+    after = ""
+    while True:
+        with transaction() as cursor:
+            cursor.execute(f"SELECT did, {columns} FROM did_keys WHERE did > %s AND {condition} ORDER BY did LIMIT %s",
+                           (after, *params, chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            yield cursor, rows
+        after = rows[-1][0]
+
+# Function to create any missing registry tables
+def apply_schema(cursor, statements=MYSQL_SCHEMA, added_columns=MYSQL_ADDED_COLUMNS, added_indexes=MYSQL_ADDED_INDEXES):
+    for statement in statements:
+        cursor.execute(statement)
+    for table, column, definition in added_columns:
+        add_column_if_missing(cursor, table, column, definition)
+    for table, index, columns, kind in added_indexes:
+        add_index_if_missing(cursor, table, index, columns, kind)
+
+# Function to add a column to an existing MySQL table unless it is already there
+def add_column_if_missing(cursor, table, column, definition):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column)
+    )
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+# Function to add an index to an existing MySQL table unless one with that name is already there
+def add_index_if_missing(cursor, table, index, columns, kind="INDEX"):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+        (table, index)
+    )
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE {table} ADD {kind} {index} {columns}")
+
+# Function to copy the legacy comma-separated allowed_did values into domain_access
+def migrate_allowed_did(transaction, chunk_size=MIGRATION_CHUNK_SIZE):
+    """Returns the number of grants found; running it again is harmless (existing grants are ignored)"""
+    count = 0
+    for cursor, rows in paged_rows(transaction, "allowed_did", "allowed_did IS NOT NULL AND allowed_did <> ''", chunk_size=chunk_size):
+        grants = []
+        for domain_did, allowed_did in rows:
+            grants.extend((domain_did, grantee_did.strip()) for grantee_did in allowed_did.split(",") if grantee_did.strip())
+        if grants:
+            cursor.executemany("INSERT IGNORE INTO domain_access (domain_did, grantee_did) VALUES (%s, %s)", grants)
+        count += len(grants)
+    return count
+
+# Function to move canAccess lists out of the Domains' metadata blobs into domain_access
+def migrate_can_access(transaction, chunk_size=MIGRATION_CHUNK_SIZE):
+    """Returns the number of canAccess entries moved; entries without a 'swid' stay in the metadata"""
+    count = 0
+    for cursor, rows in paged_rows(transaction, "metadata", "metadata LIKE %s", ('%"canAccess"%',), chunk_size=chunk_size):
+        grants = []
+        updated_metadata = []
+        for domain_did, metadata in rows:
+            domain_data = json.loads(metadata)
+            can_access = domain_data.get("canAccess")
+            if can_access is None:
+                continue
+            if not isinstance(can_access, list):
+                can_access = [can_access]
+            kept = []
+            for entry in can_access:
+                if isinstance(entry, dict) and entry.get("swid"):
+                    grants.append((domain_did, entry["swid"], json.dumps(entry)))
+                else:
+                    kept.append(entry)
+            if kept:
+                domain_data["canAccess"] = kept
+            else:
+                del domain_data["canAccess"]
+            updated_metadata.append((json.dumps(domain_data), domain_did))
+        if grants:
+            cursor.executemany(
+                "INSERT INTO domain_access (domain_did, grantee_did, access_entry) VALUES (%s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE access_entry = VALUES(access_entry)",
+                grants
+            )
+        if updated_metadata:
+            cursor.executemany("UPDATE did_keys SET metadata = %s WHERE did = %s", updated_metadata)
+        count += len(grants)
+    return count
+
+# Function to fill in content_hash for entities registered before it existed
+def backfill_content_hashes(transaction, chunk_size=MIGRATION_CHUNK_SIZE):
+    """Returns the number of rows hashed"""
+    count = 0
+    for cursor, rows in paged_rows(transaction, "metadata", "content_hash IS NULL AND metadata IS NOT NULL", chunk_size=chunk_size):
+        cursor.executemany("UPDATE did_keys SET content_hash = %s WHERE did = %s",
+                           [(canonical_hash(json.loads(metadata)), did) for did, metadata in rows])
+        count += len(rows)
+    return count
+
+# Function to fill in entity_type, name and entity_links for entities registered before they existed
+def backfill_entity_index(transaction, chunk_size=MIGRATION_CHUNK_SIZE):
+    """Returns the number of rows indexed"""
+    count = 0
+    for cursor, rows in paged_rows(transaction, "metadata", "entity_type IS NULL AND metadata IS NOT NULL", chunk_size=chunk_size):
+        fields = [(did, index_fields(json.loads(metadata))) for did, metadata in rows]
+        cursor.executemany("UPDATE did_keys SET entity_type = %s, name = %s WHERE did = %s",
+                           [(entity_type, name, did) for did, (entity_type, name, _) in fields])
+        replace_links(cursor, [(did, links) for did, (_, _, links) in fields])
+        count += len(rows)
+    return count
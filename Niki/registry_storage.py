@@ -0,0 +1,438 @@
+import abc
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from access_control import can_reach, grant_access, load_metadata, reachable_domains, recompute_access_closure
+from content_hash import find_duplicates
+from db_pool import ConnectionPool
+from entity_index import DEFAULT_PAGE_SIZE, index_fields, query_entities, replace_links
+from outbox_relay import enqueue_messages
+from registry_schema import apply_schema, backfill_content_hashes, backfill_entity_index, migrate_allowed_did, migrate_can_access
+
+# did_keys columns the registry looks values up by
+LOOKUP_COLUMNS = ("did", "kafka_topic")
+
+# Values per IN (...) query
+LOOKUP_CHUNK_SIZE = 500
+
+# did_keys columns written by insert_many and upsert_many
+WRITE_COLUMNS = ("did", "public_key", "metadata", "registered_by", "kafka_topic", "content_hash", "duplicate_key", "entity_type", "name")
+INSERT_DID_KEYS = f"INSERT INTO did_keys ({', '.join(WRITE_COLUMNS)}) VALUES ({', '.join(['%s'] * len(WRITE_COLUMNS))})"
+
+# Registry tables for the embedded SQLite backend (same columns and indexes as the MySQL registry)
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS did_keys (
+    did VARCHAR(255) PRIMARY KEY,
+    public_key TEXT,
+    metadata TEXT,
+    registered_by VARCHAR(255),
+    kafka_topic VARCHAR(255),
+    allowed_did TEXT,
+    content_hash CHAR(64),
+    duplicate_key CHAR(64),
+    entity_type VARCHAR(64),
+    name VARCHAR(255)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS uniq_did_keys_kafka_topic ON did_keys (kafka_topic);
+CREATE INDEX IF NOT EXISTS idx_did_keys_content_hash ON did_keys (content_hash);
+CREATE TABLE IF NOT EXISTS domain_access (
+    domain_did VARCHAR(255) NOT NULL,
+    grantee_did VARCHAR(255) NOT NULL,
+    access_entry TEXT,
+    granted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (domain_did, grantee_did)
+);
+CREATE INDEX IF NOT EXISTS idx_domain_access_grantee ON domain_access (grantee_did);
+CREATE TABLE IF NOT EXISTS access_closure (
+    domain_did VARCHAR(255) NOT NULL,
+    grantee_did VARCHAR(255) NOT NULL,
+    PRIMARY KEY (domain_did, grantee_did)
+);
+CREATE INDEX IF NOT EXISTS idx_access_closure_grantee ON access_closure (grantee_did, domain_did);
+CREATE TABLE IF NOT EXISTS entity_links (
+    did VARCHAR(255) NOT NULL,
+    relation VARCHAR(64) NOT NULL,
+    target_did VARCHAR(255) NOT NULL,
+    PRIMARY KEY (did, relation, target_did)
+);
+CREATE INDEX IF NOT EXISTS idx_entity_links_target ON entity_links (target_did, relation, did);
+CREATE TABLE IF NOT EXISTS kafka_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic VARCHAR(255) NOT NULL,
+    message_key VARCHAR(255),
+    payload TEXT NOT NULL,
+    message_schema VARCHAR(64),
+    create_topic INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_kafka_outbox_available ON kafka_outbox (available_at, id);
+CREATE TABLE IF NOT EXISTS pooled_topics (
+    kafka_topic VARCHAR(255) PRIMARY KEY,
+    owner VARCHAR(255) NOT NULL,
+    leased_until REAL NOT NULL
+);
+"""
+
+# Columns added after SQLite registries were first created: (table, column, definition), and the indexes that use them
+SQLITE_ADDED_COLUMNS = [
+    ("did_keys", "entity_type", "VARCHAR(64)"),
+    ("did_keys", "name", "VARCHAR(255)"),
+    ("did_keys", "duplicate_key", "CHAR(64)"),
+    ("kafka_outbox", "message_schema", "VARCHAR(64)"),
+]
+SQLITE_ADDED_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_did_keys_type ON did_keys (entity_type, did);
+CREATE INDEX IF NOT EXISTS idx_did_keys_registered_by ON did_keys (registered_by, entity_type, did);
+CREATE INDEX IF NOT EXISTS idx_did_keys_name ON did_keys (name, did);
+CREATE UNIQUE INDEX IF NOT EXISTS uniq_did_keys_duplicate_key ON did_keys (duplicate_key);
+"""
+
+
+class SQLiteCursor:
+    """Runs the registry's MySQL-style (%s placeholder) statements on SQLite"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @staticmethod
+    def _translate(statement):
+        # FOR UPDATE is not needed: SQLite lets one transaction write at a time
+        return statement.replace("%s", "?").replace("INSERT IGNORE", "INSERT OR IGNORE").replace(" FOR UPDATE", "")
+
+    def execute(self, statement, params=()):
+        self._cursor.execute(self._translate(statement), tuple(params))
+
+    def executemany(self, statement, rows):
+        self._cursor.executemany(self._translate(statement), [tuple(row) for row in rows])
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """SQLite connection in WAL mode: readers never block the writer, and commits skip the full fsync"""
+
+    def __init__(self, path, timeout=30):
+        self._connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+
+    def cursor(self, *args, **kwargs):
+        return SQLiteCursor(self._connection.cursor())
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+
+class RegistryStorage(abc.ABC):
+    """Registry operations over a pool of connections: exists, get metadata, insert, grant access and topic lookup.
+
+    Every operation runs in a transaction of its own, or in the caller's when given the cursor of a
+    transaction() block, so the writes of one registration still commit together. The SQL is shared
+    and written for MySQL; the SQLite backend's cursors translate it.
+    """
+
+    backend = None
+
+    # Insert a did_keys row or update every column of the one with the same DID (registry_dump import only)
+    upsert_statement = INSERT_DID_KEYS + " AS new ON DUPLICATE KEY UPDATE " + ", ".join(
+        f"{column} = new.{column}" for column in WRITE_COLUMNS[1:])
+
+    def __init__(self, connect, pool_size=8):
+        self.connect = connect
+        self.pool = ConnectionPool(connect, size=pool_size)
+
+    def transaction(self):
+        """Cursor on a pooled connection: commits on success, rolls back on error"""
+        return self.pool.cursor()
+
+    @contextmanager
+    def _cursor(self, cursor):
+        if cursor is not None:
+            yield cursor
+        else:
+            with self.pool.cursor() as cursor:
+                yield cursor
+
+    def set_pool_size(self, size):
+        """Replaces the connection pool with one of `size` connections"""
+        self.pool.close_all()
+        self.pool = ConnectionPool(self.connect, size=size)
+
+    def close(self):
+        self.pool.close_all()
+
+    def exists(self, did, cursor=None):
+        with self._cursor(cursor) as cursor:
+            cursor.execute("SELECT 1 FROM did_keys WHERE did = %s LIMIT 1", (did,))
+            return cursor.fetchone() is not None
+
+    def existing(self, column, values, cursor=None, chunk_size=LOOKUP_CHUNK_SIZE):
+        """Returns the set of values of a did_keys column that are already taken, one IN (...) query per chunk"""
+        if column not in LOOKUP_COLUMNS:
+            raise ValueError(f"Unsupported did_keys column: {column}")
+        values = list(values)
+        found = set()
+        if not values:
+            return found
+        with self._cursor(cursor) as cursor:
+            for start in range(0, len(values), chunk_size):
+                chunk = values[start:start + chunk_size]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(f"SELECT {column} FROM did_keys WHERE {column} IN ({placeholders})", chunk)
+                found.update(row[0] for row in cursor.fetchall())
+        return found
+
+    def get_metadata(self, did, cursor=None, include_access=True):
+        """Returns the metadata dict (with canAccess rebuilt unless include_access is False), or None"""
+        with self._cursor(cursor) as cursor:
+            if include_access:
+                return load_metadata(cursor, did)
+            cursor.execute("SELECT metadata FROM did_keys WHERE did = %s", (did,))
+            result = cursor.fetchone()
+            return json.loads(result[0]) if result else None
+
+    def insert(self, did, public_key, metadata, registered_by, kafka_topic=None, content_hash=None, duplicate_key=None, cursor=None):
+        self.insert_many([(did, public_key, metadata, registered_by, kafka_topic, content_hash, duplicate_key)], cursor=cursor)
+
+    @staticmethod
+    def _index_rows(rows):
+        records = []
+        links = []
+        for did, public_key, metadata, registered_by, kafka_topic, content_hash, duplicate_key in rows:
+            if metadata is None:
+                # A row without metadata (a dump's "metadata": null) stays NULL, with nothing to index
+                entity_type, name, entity_links = None, None, []
+            else:
+                if isinstance(metadata, str):
+                    data = json.loads(metadata)
+                else:
+                    data, metadata = metadata, json.dumps(metadata)
+                entity_type, name, entity_links = index_fields(data)
+            records.append((did, public_key, metadata, registered_by, kafka_topic, content_hash, duplicate_key, entity_type, name))
+            links.append((did, entity_links))
+        return records, links
+
+    def insert_many(self, rows, cursor=None):
+        """rows are (did, public_key, metadata, registered_by, kafka_topic, content_hash, duplicate_key) tuples of new DIDs.
+
+        metadata is the HSML dict or its JSON; its @type, name and links to other DIDs are written
+        to the query columns and entity_links in the same transaction. A DID, Kafka topic or
+        duplicate_key that is already registered raises the driver's integrity error.
+        """
+        records, links = self._index_rows(rows)
+        with self._cursor(cursor) as cursor:
+            cursor.executemany(INSERT_DID_KEYS, records)
+            replace_links(cursor, links)
+
+    def upsert_many(self, rows, cursor=None):
+        """Like insert_many, but a DID that is already registered has its row overwritten.
+
+        Raises ValueError when a row's kafka_topic belongs to another DID, before writing anything.
+        """
+        records, links = self._index_rows(rows)
+        with self._cursor(cursor) as cursor:
+            topics = {record[4]: record[0] for record in records if record[4]}
+            owners = self.existing_topic_owners(list(topics), cursor=cursor)
+            clashes = [f"{topic} (owned by {owner}, not {topics[topic]})" for topic, owner in owners.items() if owner != topics[topic]]
+            if clashes:
+                raise ValueError(f"Kafka topics already registered to another DID: {', '.join(clashes)}")
+            cursor.executemany(self.upsert_statement, records)
+            replace_links(cursor, links)
+
+    def existing_topic_owners(self, kafka_topics, cursor=None, chunk_size=LOOKUP_CHUNK_SIZE):
+        """Returns {kafka_topic: did} for the given topics that are registered, locking their rows"""
+        owners = {}
+        with self._cursor(cursor) as cursor:
+            for start in range(0, len(kafka_topics), chunk_size):
+                chunk = kafka_topics[start:start + chunk_size]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(f"SELECT kafka_topic, did FROM did_keys WHERE kafka_topic IN ({placeholders}) FOR UPDATE", chunk)
+                owners.update(cursor.fetchall())
+        return owners
+
+    def enqueue_messages(self, messages, cursor=None):
+        """Queues (topic, key, payload JSON, create_topic, schema) Kafka messages for the outbox relay; pass the registration's cursor"""
+        if messages:
+            with self._cursor(cursor) as cursor:
+                enqueue_messages(cursor, messages)
+
+    def query(self, entity_type=None, registered_by=None, name=None, name_prefix=None, linked_to=None, relation="linkedTo",
+              after=None, limit=DEFAULT_PAGE_SIZE, include_metadata=False, cursor=None):
+        """One page of entities matching every given filter; see entity_index.query_entities"""
+        with self._cursor(cursor) as cursor:
+            return query_entities(cursor, entity_type=entity_type, registered_by=registered_by, name=name, name_prefix=name_prefix,
+                                  linked_to=linked_to, relation=relation, after=after, limit=limit, include_metadata=include_metadata)
+
+    def grant_access(self, domain_did, grantee_did, access_entry=None, cursor=None):
+        """Returns True if the grant is new"""
+        with self._cursor(cursor) as cursor:
+            return grant_access(cursor, domain_did, grantee_did, access_entry=access_entry)
+
+    def can_reach(self, domain_did, grantee_did, cursor=None):
+        """True if grantee_did has access to domain_did directly or through delegated grants (one access_closure lookup)"""
+        with self._cursor(cursor) as cursor:
+            return can_reach(cursor, domain_did, grantee_did)
+
+    def reachable_domains(self, grantee_did, cursor=None):
+        with self._cursor(cursor) as cursor:
+            return reachable_domains(cursor, grantee_did)
+
+    def recompute_access_closure(self, cursor=None):
+        """Rebuilds access_closure from domain_access; returns the number of pairs"""
+        with self._cursor(cursor) as cursor:
+            return recompute_access_closure(cursor)
+
+    def get_topic(self, did, cursor=None):
+        """Returns the Kafka topic of a registered Agent, or None"""
+        with self._cursor(cursor) as cursor:
+            cursor.execute("SELECT kafka_topic FROM did_keys WHERE did = %s", (did,))
+            result = cursor.fetchone()
+            return result[0] if result else None
+
+    def get_topic_owner(self, kafka_topic, cursor=None):
+        """Returns the DID of the Agent a Kafka topic belongs to, or None"""
+        with self._cursor(cursor) as cursor:
+            cursor.execute("SELECT did FROM did_keys WHERE kafka_topic = %s", (kafka_topic,))
+            result = cursor.fetchone()
+            return result[0] if result else None
+
+    def claim_pooled_topics(self, topic_names, owner, lease_seconds, cursor=None, chunk_size=LOOKUP_CHUNK_SIZE):
+        """Leases pooled Kafka topics to `owner` for lease_seconds and returns the set of names it now holds.
+
+        A topic is claimed when nobody holds it, its lease ran out, or `owner` holds it already (renewing it).
+        """
+        now = time.time()
+        topic_names = list(topic_names)
+        claimed = set()
+        with self._cursor(cursor) as cursor:
+            for start in range(0, len(topic_names), chunk_size):
+                chunk = topic_names[start:start + chunk_size]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.executemany("INSERT IGNORE INTO pooled_topics (kafka_topic, owner, leased_until) VALUES (%s, %s, %s)",
+                                   [(name, owner, now + lease_seconds) for name in chunk])
+                cursor.execute(f"UPDATE pooled_topics SET owner = %s, leased_until = %s "
+                               f"WHERE kafka_topic IN ({placeholders}) AND (owner = %s OR leased_until < %s)",
+                               (owner, now + lease_seconds, *chunk, owner, now))
+                cursor.execute(f"SELECT kafka_topic FROM pooled_topics WHERE kafka_topic IN ({placeholders}) AND owner = %s", (*chunk, owner))
+                claimed.update(row[0] for row in cursor.fetchall())
+        return claimed
+
+    def forget_pooled_topics(self, topic_names, cursor=None, chunk_size=LOOKUP_CHUNK_SIZE):
+        """Drops the leases of pooled topics that are now assigned to an Agent"""
+        topic_names = list(topic_names)
+        with self._cursor(cursor) as cursor:
+            for start in range(0, len(topic_names), chunk_size):
+                chunk = topic_names[start:start + chunk_size]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(f"DELETE FROM pooled_topics WHERE kafka_topic IN ({placeholders})", chunk)
+
+    def find_duplicates(self, content_hashes, registered_by=None, cursor=None):
+        with self._cursor(cursor) as cursor:
+            return find_duplicates(cursor, content_hashes, registered_by)
+
+    @abc.abstractmethod
+    def migrate(self, rebuild_access_closure=True):
+        """Brings the schema and data up to date; returns counts of what was moved or filled in.
+
+        Pass rebuild_access_closure=False when the caller rebuilds access_closure itself afterwards.
+        """
+
+
+class MySQLStorage(RegistryStorage):
+    backend = "mysql"
+
+    def __init__(self, config, pool_size=8):
+        self.config = config
+        super().__init__(self._connect, pool_size=pool_size)
+
+    def _connect(self):
+        import mysql.connector  # Only needed once a registry in MySQL is actually used
+        return mysql.connector.connect(**self.config)
+
+    def migrate(self, rebuild_access_closure=True):
+        with self.transaction() as cursor:
+            apply_schema(cursor)
+        # The data migrations commit a page of rows at a time
+        counts = {
+            "allowed_did_grants": migrate_allowed_did(self.transaction),
+            "can_access_entries": migrate_can_access(self.transaction),
+            "content_hashes": backfill_content_hashes(self.transaction),
+            "indexed_entities": backfill_entity_index(self.transaction),
+        }
+        with self.transaction() as cursor:
+            counts["access_closure_pairs"] = recompute_access_closure(cursor) if rebuild_access_closure else None
+        return counts
+
+
+class SQLiteStorage(RegistryStorage):
+    """Embedded registry in one SQLite file, for nodes without a database server.
+
+    WAL mode lets any number of pooled connections read while one writes. Use a file path:
+    every connection to ":memory:" would get a database of its own.
+    """
+
+    backend = "sqlite"
+
+    upsert_statement = INSERT_DID_KEYS + " ON CONFLICT(did) DO UPDATE SET " + ", ".join(
+        f"{column} = excluded.{column}" for column in WRITE_COLUMNS[1:])
+
+    def __init__(self, path="did_registry.db", pool_size=8):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(path)
+        try:
+            connection.executescript(SQLITE_SCHEMA)
+            for table, column, definition in SQLITE_ADDED_COLUMNS:
+                if column not in {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}:
+                    connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            connection.executescript(SQLITE_ADDED_INDEXES)
+        finally:
+            connection.close()
+        super().__init__(lambda: SQLiteConnection(path), pool_size=pool_size)
+
+    def migrate(self, rebuild_access_closure=True):
+        # The tables are created on open; only data written by older versions needs moving, a page of rows at a time
+        counts = {
+            "allowed_did_grants": migrate_allowed_did(self.transaction),
+            "can_access_entries": 0,
+            "content_hashes": backfill_content_hashes(self.transaction),
+            "indexed_entities": backfill_entity_index(self.transaction),
+        }
+        with self.transaction() as cursor:
+            counts["access_closure_pairs"] = recompute_access_closure(cursor) if rebuild_access_closure else None
+        return counts
+
+
+# Function to open the registry on the configured backend
+def open_storage(backend="mysql", mysql_config=None, sqlite_path="did_registry.db", pool_size=8):
+    if backend == "mysql":
+        return MySQLStorage(mysql_config, pool_size=pool_size)
+    if backend == "sqlite":
+        return SQLiteStorage(sqlite_path, pool_size=pool_size)
+    raise ValueError(f"Unknown registry backend: {backend} (expected 'mysql' or 'sqlite')")
@@ -0,0 +1,148 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Environment variable holding the HMAC secret; tokens survive restarts and work across processes sharing it
+SESSION_SECRET_ENV = "REGISTRATION_SESSION_SECRET"
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def token_fingerprint(token):
+    """Short SHA-256 of a token, to tell sessions apart in logs without printing the bearer token"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:12]
+
+
+class SessionManager:
+    """Signed, short-lived session tokens for logged in Persons and Organizations.
+
+    A token is "<payload>.<signature>", where the payload is base64url JSON with the DID, its role
+    (@type) and an expiry, and the signature is an HMAC-SHA256 of the payload. Verified tokens sit in a
+    bounded in-memory cache until they expire, so a repeat request costs one dict lookup: no key
+    parsing and no metadata query. A registration revoked in the database stays usable until its
+    token expires, which is why the TTL is short. Expired and revoked entries are purged on issue()
+    and revoke(), at most every `purge_interval` seconds.
+    """
+
+    def __init__(self, secret=None, ttl=900, max_entries=10000, purge_interval=60):
+        if secret is None:
+            secret = os.environ.get(SESSION_SECRET_ENV)
+        # Without a configured secret, tokens are only valid for the life of this process
+        self.secret = secret.encode("utf-8") if isinstance(secret, str) else (secret or os.urandom(32))
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.purge_interval = purge_interval
+        self._next_purge = time.time() + purge_interval
+        self._cache = OrderedDict()  # token -> (did, role, expires_at), oldest first
+        self._revoked = {}  # token -> expires_at, kept until the token would have expired anyway
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.secret, payload.encode("utf-8"), hashlib.sha256).digest())
+
+    def _remember(self, token, session):
+        """Caches a session; returns False, caching nothing, for a token revoked meanwhile"""
+        with self._lock:
+            if token in self._revoked:
+                return False
+            self._cache[token] = session
+            self._cache.move_to_end(token)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return True
+
+    def _purge_due(self):
+        now = time.time()
+        with self._lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+        self.purge_expired()
+
+    def _decode(self, token):
+        """Returns (did, role, expires_at) from a token with a valid signature, otherwise None"""
+        payload, _, signature = token.partition(".")
+        try:
+            # Bytes on both sides: compare_digest rejects str holding anything but ASCII
+            if not signature or not hmac.compare_digest(signature.encode("utf-8"), self._sign(payload).encode("ascii")):
+                return None
+            claims = json.loads(_b64decode(payload))
+            return claims["sub"], claims["role"], int(claims["exp"])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def issue(self, did, role):
+        """Returns (token, expires_at) for an authenticated DID"""
+        self._purge_due()
+        expires_at = int(time.time()) + self.ttl
+        claims = {"sub": did, "role": role, "exp": expires_at, "nonce": _b64encode(os.urandom(8))}
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        token = f"{payload}.{self._sign(payload)}"
+        self._remember(token, (did, role, expires_at))
+        return token, expires_at
+
+    def verify(self, token):
+        """Returns (did, role) for a valid unexpired token, otherwise None"""
+        if not token or not isinstance(token, str):
+            return None
+        now = time.time()
+        with self._lock:
+            session = self._cache.get(token)
+            if session is not None:
+                if session[2] > now:
+                    self.hits += 1
+                    return session[0], session[1]
+                del self._cache[token]
+                return None
+            self.misses += 1
+            if token in self._revoked:
+                return None
+
+        # Not cached (another process issued it, or it was evicted): check the signature and expiry
+        session = self._decode(token)
+        if session is None or session[2] <= now or not self._remember(token, session):
+            return None
+        return session[0], session[1]
+
+    def revoke(self, token):
+        """Logs a session out: the token stops verifying in this process"""
+        self._purge_due()
+        if not isinstance(token, str):
+            return
+        with self._lock:
+            session = self._cache.pop(token, None)
+        # Only a token this secret signed can verify later, so only those need remembering
+        if session is None:
+            session = self._decode(token)
+        if session is not None and session[2] > time.time():
+            with self._lock:
+                self._revoked[token] = session[2]
+                # A verify() running alongside may have cached the token again since the pop above
+                self._cache.pop(token, None)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [token for token, session in self._cache.items() if session[2] <= now]
+            for token in expired:
+                del self._cache[token]
+            for token in [token for token, expires_at in self._revoked.items() if expires_at <= now]:
+                del self._revoked[token]
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {"cached": len(self._cache), "revoked": len(self._revoked), "hits": self.hits, "misses": self.misses, "ttl": self.ttl}
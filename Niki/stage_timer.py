@@ -0,0 +1,124 @@
+import bisect
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in nanoseconds: 1 microsecond to ~4.5 minutes, 4 buckets per doubling
+# (each bucket is ~19% wide, so interpolated percentiles stay well within sub-millisecond resolution)
+BUCKET_BOUNDS_NS = [int(1000 * 2 ** (i / 4)) for i in range(0, 4 * 38 + 1)]
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram: constant memory however many samples are recorded"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_NS) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.sum_ns = 0
+        self.min_ns = None
+        self.max_ns = None
+
+    def record(self, duration_ns):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_NS, duration_ns)] += 1
+        self.count += 1
+        self.sum_ns += duration_ns
+        self.min_ns = duration_ns if self.min_ns is None else min(self.min_ns, duration_ns)
+        self.max_ns = duration_ns if self.max_ns is None else max(self.max_ns, duration_ns)
+
+    def percentile(self, q):
+        """Returns the q-th percentile (0-100) in nanoseconds, interpolated inside its bucket"""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = BUCKET_BOUNDS_NS[i - 1] if i > 0 else 0
+                upper = BUCKET_BOUNDS_NS[i] if i < len(BUCKET_BOUNDS_NS) else self.max_ns
+                estimate = lower + (upper - lower) * (rank - cumulative) / bucket_count
+                return min(max(estimate, self.min_ns), self.max_ns)
+            cumulative += bucket_count
+        return self.max_ns
+
+    def summary(self):
+        def ms(ns):
+            return None if ns is None else round(ns / 1e6, 4)
+        return {
+            "count": self.count,
+            "sum_ms": ms(self.sum_ns),
+            "mean_ms": ms(self.sum_ns / self.count) if self.count else None,
+            "min_ms": ms(self.min_ns),
+            "p50_ms": ms(self.percentile(50)),
+            "p95_ms": ms(self.percentile(95)),
+            "p99_ms": ms(self.percentile(99)),
+            "max_ms": ms(self.max_ns),
+        }
+
+
+class StageTimer:
+    """Collects per-stage latency histograms from `with timer.span("stage"):` blocks"""
+
+    def __init__(self, metric_name="registration_stage_duration_seconds"):
+        self.metric_name = metric_name
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter_ns() - start)
+
+    def timed(self, stage):
+        """Decorator recording every call of the wrapped function as one `stage` span"""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, stage, duration_ns):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.record(duration_ns)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def summary(self):
+        with self._lock:
+            return {stage: histogram.summary() for stage, histogram in self._histograms.items()}
+
+    def to_json(self, indent=None):
+        return json.dumps(self.summary(), indent=indent)
+
+    def to_prometheus(self):
+        """Prometheus text exposition format: one histogram series per stage"""
+        lines = [
+            f"# HELP {self.metric_name} Duration of each registration stage in seconds.",
+            f"# TYPE {self.metric_name} histogram",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound_ns, bucket_count in zip(BUCKET_BOUNDS_NS, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.metric_name}_bucket{{stage="{stage}",le="{bound_ns / 1e9:.9g}"}} {cumulative}')
+                lines.append(f'{self.metric_name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{self.metric_name}_sum{{stage="{stage}"}} {histogram.sum_ns / 1e9:.9f}')
+                lines.append(f'{self.metric_name}_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Writes Prometheus text for a .prom path and JSON for anything else"""
+        with open(path, "w") as output_file:
+            output_file.write(self.to_prometheus() if path.endswith(".prom") else self.to_json(indent=4))
@@ -0,0 +1,204 @@
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from confluent_kafka.admin import NewTopic
+
+
+class TopicPool:
+    """Kafka topics created ahead of time in batches and handed out one per new Agent.
+
+    Pooled topics are named `<prefix><random hex>`; the Agent they are handed to is
+    recorded by the caller in did_keys.kafka_topic. start() it once when the process
+    starts, then its thread keeps the pool filled. acquire() never waits on the broker
+    or the database; until the pool has topics it hands out none and the caller names
+    a topic itself.
+
+    Several processes may pool topics on one registry, so every pooled topic is leased
+    to this pool's `owner` for `lease_seconds` through `claim`, and the thread renews
+    the leases of the topics it holds every third of that. A topic handed out therefore
+    stays leased for at least two thirds of lease_seconds while its registration commits.
+    At startup the thread claims broker topics with the pool prefix that no Agent owns
+    and nobody holds a live lease on (left over by a crash or a stopped process); without
+    `claim` nothing is reclaimed.
+    """
+
+    def __init__(self, admin_client, size=16, batch_size=None, prefix="hsml_agent_", num_partitions=1,
+                 replication_factor=1, find_assigned=None, claim=None, forget=None, owner=None, lease_seconds=600):
+        self.admin_client = admin_client
+        self.size = size
+        self.batch_size = batch_size or size
+        self.prefix = prefix
+        self.num_partitions = num_partitions
+        self.replication_factor = replication_factor
+        # Callable taking a list of topic names and returning the ones already assigned to an Agent
+        self.find_assigned = find_assigned
+        # Callable (topic names, owner, lease_seconds) returning the names now leased to owner, and
+        # callable dropping the leases of topics assigned to an Agent
+        self.claim = claim
+        self.forget = forget
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        self.low_water = size // 2
+        self._topics = queue.Queue()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._lost = set()  # Pooled topics whose lease another process took over
+        self._thread = None
+        self.created = 0
+        self.failed = 0
+        self.handed_out = 0
+        self.misses = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+            self._stopped.clear()
+            self._wakeup.set()
+            self._thread = threading.Thread(target=self._refill_loop, name="kafka-topic-pool", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def acquire(self):
+        """Returns a ready topic name, or None when the pool is empty (the caller creates one itself)"""
+        topics = self.acquire_many(1)
+        return topics[0] if topics else None
+
+    def acquire_many(self, count):
+        """Returns up to `count` ready topic names without waiting on the broker"""
+        topics = []
+        while len(topics) < count:
+            try:
+                topic = self._topics.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                if topic in self._lost:
+                    self._lost.discard(topic)
+                    continue
+            topics.append(topic)
+        self.handed_out += len(topics)
+        self.misses += count - len(topics)
+        if self._topics.qsize() <= self.low_water:
+            self._wakeup.set()
+        return topics
+
+    def release(self, topic_name):
+        """Puts back a topic whose registration did not commit"""
+        self._topics.put(topic_name)
+
+    def qsize(self):
+        return self._topics.qsize()
+
+    def stats(self):
+        return {
+            "available": self._topics.qsize(),
+            "created": self.created,
+            "failed": self.failed,
+            "handed_out": self.handed_out,
+            "misses": self.misses,
+        }
+
+    def _pooled(self):
+        with self._topics.mutex:
+            return list(self._topics.queue)
+
+    def _reclaim_unassigned(self):
+        if self.claim is None:
+            return  # Another process may be holding them
+        try:
+            existing = [name for name in self.admin_client.list_topics(timeout=10).topics if name.startswith(self.prefix)]
+        except Exception as e:
+            print(f"Could not list Kafka topics to reclaim pooled topics: {e}")
+            return
+        if not existing:
+            return
+        try:
+            assigned = self.find_assigned(existing) if self.find_assigned is not None else set()
+            if assigned and self.forget is not None:
+                self.forget(assigned)
+            claimed = self.claim([name for name in existing if name not in assigned], self.owner, self.lease_seconds)
+        except Exception as e:
+            print(f"Could not reclaim pooled Kafka topics: {e}")
+            return
+        pooled = set(self._pooled())
+        for name in claimed:
+            if name not in pooled:
+                self._topics.put(name)
+
+    def _renew_leases(self):
+        pooled = self._pooled()
+        if not pooled:
+            return
+        try:
+            claimed = self.claim(pooled, self.owner, self.lease_seconds)
+        except Exception as e:
+            print(f"Could not renew the leases of pooled Kafka topics: {e}")
+            return
+        with self._lock:
+            self._lost.update(name for name in pooled if name not in claimed)
+
+    def _create_batch(self, count):
+        names = [f"{self.prefix}{uuid.uuid4().hex[:16]}" for _ in range(count)]
+        new_topics = [NewTopic(name, num_partitions=self.num_partitions, replication_factor=self.replication_factor) for name in names]
+        try:
+            fs = self.admin_client.create_topics(new_topics)
+        except Exception as e:
+            self.failed += count
+            print(f"Failed to create pooled topics: {e}")
+            return
+        created = []
+        for topic, f in fs.items():
+            try:
+                f.result()  # Wait here, in the background, so Agents never do
+                created.append(topic)
+            except Exception as e:
+                self.failed += 1
+                print(f"Failed to create pooled topic '{topic}': {e}")
+        if created and self.claim is not None:
+            try:
+                leased = self.claim(created, self.owner, self.lease_seconds)
+            except Exception as e:
+                leased = set()
+                print(f"Could not lease new pooled Kafka topics: {e}")
+            # Unleased topics are left for a later reclaim
+            self.failed += len(created) - len(leased)
+            created = [topic for topic in created if topic in leased]
+        for topic in created:
+            self._topics.put(topic)
+            self.created += 1
+
+    def _refill_loop(self):
+        self._reclaim_unassigned()
+        renew_interval = self.lease_seconds / 3 if self.claim is not None else None
+        next_renewal = time.monotonic() + (renew_interval or 0)
+        while not self._stopped.is_set():
+            timeout = None if renew_interval is None else max(0.0, next_renewal - time.monotonic())
+            woken = self._wakeup.wait(timeout)
+            if renew_interval is not None and time.monotonic() >= next_renewal:
+                self._renew_leases()
+                next_renewal = time.monotonic() + renew_interval
+            if not woken:
+                continue
+            self._wakeup.clear()
+            while not self._stopped.is_set():
+                missing = self.size - self._topics.qsize()
+                if missing <= 0:
+                    break
+                failed_before = self.failed
+                self._create_batch(min(missing, self.batch_size))
+                if self.failed > failed_before:
+                    # Broker trouble: wait for the next acquire instead of retrying in a tight loop
+                    break